@@ -22,41 +22,87 @@
 
 import abc
 import time
-from typing import Dict, Any
-import anthropic
-import datetime
+from typing import Dict, List, Optional
 import os
 import requests
 import json
-from pyjson5 import load as json5_load
 from io import StringIO
 import re
+import random
 import shutil
-import time
-from functools import wraps
-import copy
+from functools import wraps, lru_cache
+from collections import deque
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import shlex
+import selectors
 import signal
 import subprocess
 import tempfile
 import threading
-import queue
 import atexit
-from typing import Optional
+import codecs
 import psutil
 import difflib
+import hashlib
 import argparse
-import queue
-import psutil
-from typing import List, Dict
+import concurrent.futures
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Fall back to the standard library json module
+
+try:
+    import h2  # Lets httpx speak HTTP/2
+except ImportError:
+    h2 = None
+
+def parse_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def to_json_line(entry):
+    # Serialize one compact record for a JSONL file, as bytes for a binary append
+    if orjson is not None:
+        return orjson.dumps(entry) + b'\n'
+    return json.dumps(entry).encode('utf-8') + b'\n'
+
+def pretty_json(data):
+    # Indented JSON for embedding in prompts
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, indent=2)
+
+def compact_json(data):
+    # Unindented JSON for records embedded in prompts, where indentation only
+    # adds tokens and serialization time
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'))
+
+def read_json_file(file_path):
+    if orjson is not None:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+def write_json_file(file_path, data):
+    if orjson is not None:
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=2)
 
 # Global variables for model and source settings
 MODEL = 'claude'  # Default to 'claude'
@@ -67,6 +113,10 @@ REGION = None
 OPENAI_BASE_URL = 'https://api.openai.com/v1'
 NEWLINE = "\n"
 DEBUG_PROMPT = False
+GENERATE_USE_BATCH = False  # Submit generate() file requests through the Message Batches API
+BATCH_POLL_INTERVAL = 30  # Seconds between batch status checks
+BATCH_TIMEOUT = 24 * 60 * 60  # Seconds to wait for a batch before cancelling it and falling back to individual requests
+RESPONSE_CACHE_ENABLED = True  # Serve repeated generate-mode prompts from the on-disk response cache
 
 # Define the devlm folder path
 DEVLM_FOLDER = ".devlm"
@@ -113,6 +163,13 @@ APPROVAL_REQUIRED_COMMANDS = [
     'RAW: <raw_command>'
 ]
 
+def command_prefix_pattern(prefixes):
+    # One compiled alternation instead of a startswith per prefix
+    return re.compile('|'.join(re.escape(prefix) for prefix in prefixes))
+
+APPROVAL_COMMAND_PATTERN = command_prefix_pattern(APPROVAL_REQUIRED_COMMANDS)
+RUNNABLE_COMMAND_PATTERN = command_prefix_pattern(ALLOWED_COMMANDS + APPROVAL_REQUIRED_COMMANDS)
+
 try:
     import anthropic
     from anthropic import AnthropicVertex
@@ -126,9 +183,56 @@ class LLMError(Exception):
         self.message = message
         super().__init__(f"{error_type}: {message}")
 
+RETRY_MAX_DELAY = 60  # Upper bound in seconds for one backoff sleep when the API gives no hint
+
+def retry_after_seconds(error):
+    # Seconds the API asked us to wait, from the Retry-After or
+    # anthropic-ratelimit-*-reset headers of an error response; None if absent
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    resets = []
+    for name in ('anthropic-ratelimit-requests-reset', 'anthropic-ratelimit-tokens-reset'):
+        value = headers.get(name)
+        if value:
+            try:
+                reset_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError:
+                continue
+            resets.append((reset_at - datetime.now(reset_at.tzinfo)).total_seconds())
+    return max(0.0, max(resets)) if resets else None
+
+def decorrelated_jitter(previous_delay, base_delay=1, max_delay=RETRY_MAX_DELAY):
+    return min(max_delay, random.uniform(base_delay, previous_delay * 3))
+
+def build_message_content(prompt: str, cached_prefix: Optional[str] = None):
+    # Mark a shared leading part of the prompt as cacheable, so follow-up requests
+    # that start with the same text (the analysis prompts start with the action
+    # prompt) are billed and served as prompt-cache reads
+    if not cached_prefix or not prompt.startswith(cached_prefix):
+        return prompt
+    content = [{"type": "text", "text": cached_prefix, "cache_control": {"type": "ephemeral"}}]
+    rest = prompt[len(cached_prefix):]
+    if rest.strip():
+        content.append({"type": "text", "text": rest})
+    return content
+
+def build_http_client():
+    # With h2 installed, concurrent requests from the generate() worker pool share one
+    # HTTP/2 connection instead of each holding its own; otherwise use the SDK default
+    if h2 is None or not hasattr(anthropic, "DefaultHttpxClient"):
+        return None
+    return anthropic.DefaultHttpxClient(http2=True)
+
 class LLMInterface(abc.ABC):
     @abc.abstractmethod
-    def generate_response(self, prompt: str, max_tokens: int) -> str:
+    def generate_response(self, prompt: str, max_tokens: int, cached_prefix: Optional[str] = None) -> str:
         pass
 
     def _write_debug_prompt(self, prompt: str):
@@ -144,8 +248,13 @@ class LLMInterface(abc.ABC):
 class AnthropicLLM(LLMInterface):
     def __init__(self, client):
         self.client = client
+        self.model = "claude-3-5-sonnet-20241022"
+        self.max_retries = 5
+        self.base_delay = 1
+        self.retries = 0
+        self.delay = self.base_delay  # Last backoff delay, grown with decorrelated jitter
 
-    def generate_response(self, prompt: str, max_tokens: int) -> str:
+    def generate_response(self, prompt: str, max_tokens: int, cached_prefix: Optional[str] = None) -> str:
         self._write_debug_prompt(prompt)
         Global_error = ""
         # make sure the prompt length is less than 200000 else truncate it
@@ -156,12 +265,14 @@ class AnthropicLLM(LLMInterface):
         while True:
             try:
                 response = self.client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
+                    model=self.model,
                     max_tokens=max_tokens,
                     messages=[
-                        {"role": "user", "content": prompt}
+                        {"role": "user", "content": build_message_content(prompt, cached_prefix)}
                     ]
                 )
+                self.retries = 0
+                self.delay = self.base_delay
                 return response.content[0].text if response.content else ""
 
             except anthropic.APIError as e:
@@ -171,7 +282,7 @@ class AnthropicLLM(LLMInterface):
                     error_type = error.get('type', 'unknown_error')
                     error_message = error.get('message', str(e))
                     
-                    if self._handle_error(error_type, error_message):
+                    if self._handle_error(error_type, error_message, retry_after_seconds(e)):
                         continue  # Retry after handling the error
                     else:
                         raise LLMError(error_type, error_message)
@@ -184,15 +295,56 @@ class AnthropicLLM(LLMInterface):
                 print(f"Unexpected error: {str(e)}")
                 raise
 
-    def _handle_error(self, error_type, error_message):
+    def generate_responses_batch(self, prompts: Dict[str, str], max_tokens: int, cached_prefix: Optional[str] = None) -> Dict[str, str]:
+        # Submit all prompts as one Message Batch and wait for it to finish. Returns
+        # {custom_id: text} for the requests that succeeded; callers retry the rest.
+        requests = [
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": self.model,
+                    "max_tokens": max_tokens,
+                    "messages": [{"role": "user", "content": build_message_content(prompt, cached_prefix)}]
+                }
+            }
+            for custom_id, prompt in prompts.items()
+        ]
+        batch = self.client.messages.batches.create(requests=requests)
+        print(f"Submitted batch {batch.id} with {len(requests)} requests")
+        deadline = time.monotonic() + BATCH_TIMEOUT
+        while batch.processing_status != "ended":
+            if time.monotonic() >= deadline:
+                # Returning nothing makes the caller request every file individually
+                print(f"Batch {batch.id} did not finish within {BATCH_TIMEOUT} seconds. Cancelling it.")
+                try:
+                    self.client.messages.batches.cancel(batch.id)
+                except anthropic.APIError as e:
+                    print(f"Failed to cancel batch {batch.id}: {str(e)}")
+                return {}
+            time.sleep(BATCH_POLL_INTERVAL)
+            try:
+                batch = self.client.messages.batches.retrieve(batch.id)
+            except (anthropic.APIConnectionError, anthropic.RateLimitError, anthropic.InternalServerError) as e:
+                # A failed status check doesn't affect the batch itself; try again next poll
+                print(f"Checking batch {batch.id} failed, retrying: {str(e)}")
+        responses = {}
+        for result in self.client.messages.batches.results(batch.id):
+            if result.result.type == "succeeded":
+                message = result.result.message
+                responses[result.custom_id] = message.content[0].text if message.content else ""
+            else:
+                print(f"Batch request {result.custom_id} {result.result.type}")
+        return responses
+
+    def _handle_error(self, error_type, error_message, retry_after=None):
         if error_type == 'rate_limit_error':
             if 'daily rate limit' in error_message.lower():
                 self._wait_until_midnight()
             else:
-                self._handle_rate_limit(error_message)
+                self._handle_rate_limit(error_message, retry_after)
             return True
         elif error_type == 'overloaded_error':
-            self._handle_overloaded()
+            self._handle_overloaded(retry_after)
             return True
         elif error_type == 'invalid_request_error' and 'credit balance is too low' in error_message.lower():
             self._handle_credit_issue()
@@ -211,33 +363,43 @@ class AnthropicLLM(LLMInterface):
     def _calculate_wait_time(self, retries):
         return self.base_delay * (2 ** retries) + random.uniform(0, 1)
 
+    def _backoff_delay(self, retry_after=None):
+        # Use the server's hint when it gives one, otherwise back off with decorrelated jitter
+        if retry_after is not None:
+            return retry_after
+        self.delay = decorrelated_jitter(self.delay, self.base_delay)
+        return self.delay
+
     def _wait_until_midnight(self):
-        now = datetime.datetime.now()
-        tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        now = datetime.now()
+        tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
         wait_time = (tomorrow - now).total_seconds()
         print(f"Daily rate limit reached. Waiting until midnight ({tomorrow.strftime('%Y-%m-%d %H:%M:%S')})...")
         time.sleep(wait_time)
 
 
-    def _handle_rate_limit(self, error_message):
-        wait_time = 60  # Default to 60 seconds
-        # Try to extract wait time from error message if available
-        try:
-            wait_time = int(error_message.split("try again in ")[1].split(" ")[0])
-        except:
-            pass
-        print(f"Rate limit exceeded. Retrying in {wait_time} seconds...")
+    def _handle_rate_limit(self, error_message, retry_after=None):
+        wait_time = retry_after
+        # Fall back to a wait time in the error message, then to jittered backoff
+        if wait_time is None:
+            try:
+                wait_time = int(error_message.split("try again in ")[1].split(" ")[0])
+            except:
+                wait_time = self._backoff_delay()
+        print(f"Rate limit exceeded. Retrying in {wait_time:.1f} seconds...")
         time.sleep(wait_time)
 
-    def _handle_overloaded(self):
-        wait_time = 60
-        print(f"API temporarily overloaded. Retrying in {wait_time} seconds...")
+    def _handle_overloaded(self, retry_after=None):
+        wait_time = self._backoff_delay(retry_after)
+        print(f"API temporarily overloaded. Retrying in {wait_time:.1f} seconds...")
         time.sleep(wait_time)
 
     def _handle_credit_issue(self):
         print("Your account has insufficient credit. Please add credit to your account.")
         input("Press Enter once you've added credit to continue, or Ctrl+C to exit...")
 
+WAIT_SECONDS_PATTERN = re.compile(r'(\d+)\s*seconds?', re.IGNORECASE)
+
 class OpenAILLM(LLMInterface):
     def __init__(self, api_key: str, model: str = "gpt-4", base_url: Optional[str] = None):
         # Import required modules only when OpenAI LLM is initialized
@@ -247,7 +409,6 @@ class OpenAILLM(LLMInterface):
             import time
             import random
             import os
-            import re
             from typing import Optional
         except ImportError as e:
             missing_package = str(e).split("'")[1]
@@ -262,7 +423,6 @@ class OpenAILLM(LLMInterface):
         self._OpenAI = OpenAI
         self._time = time
         self._random = random
-        self._re = re
         
         # Initialize the client with optional base_url
         client_kwargs = {"api_key": api_key}
@@ -282,7 +442,8 @@ class OpenAILLM(LLMInterface):
         self.retries = 0
         self.base_url = base_url
 
-    def generate_response(self, prompt: str, max_tokens: int) -> str:
+    def generate_response(self, prompt: str, max_tokens: int, cached_prefix: Optional[str] = None) -> str:
+        # OpenAI-compatible servers cache shared prefixes automatically, so cached_prefix is unused
         self._write_debug_prompt(prompt)
         # Make sure the prompt length is less than 200000 else truncate it
         if len(prompt) > GLOBAL_MAX_PROMPT_LENGTH:
@@ -371,7 +532,7 @@ class OpenAILLM(LLMInterface):
     def _extract_wait_time(self, error_message: str) -> int:
         """Extract wait time from rate limit error message."""
         try:
-            match = self._re.search(r'(\d+)\s*seconds?', error_message.lower())
+            match = WAIT_SECONDS_PATTERN.search(error_message)
             if match:
                 return int(match.group(1))
         except:
@@ -392,22 +553,23 @@ class OpenAILLM(LLMInterface):
         }
 
 class VertexAILLM(LLMInterface):
-    def __init__(self, project_id: str, region: str, model: Optional[str] = None):
+    def __init__(self, project_id: str, region: str, model: Optional[str] = None, credentials=None):
         self.project_id = project_id
         self.region = region
-        self.client = AnthropicVertex(region=region, project_id=project_id)
+        self.client = AnthropicVertex(region=region, project_id=project_id, credentials=credentials,
+                                      http_client=build_http_client())
         self.max_retries = 5
-        self.retry_delay = 32  # Start with 32 seconds delay
+        self.retry_delay = 1  # Grows with decorrelated jitter up to 64 seconds
         self.model = model or "claude-3-5-sonnet-v2@20241022"  # Default model
 
-    def generate_response(self, prompt: str, max_tokens: int) -> str:
+    def generate_response(self, prompt: str, max_tokens: int, cached_prefix: Optional[str] = None) -> str:
         self._write_debug_prompt(prompt)
         # make sure the prompt length is less than 200000 else truncate it
         if len(prompt) > 200000:
             prompt = prompt[:200000]
             Global_error = GLOBAL_ERROR_PROMPT_LENGTH
             print(Global_error)
-        messages = [{"role": "user", "content": prompt}]
+        messages = [{"role": "user", "content": build_message_content(prompt, cached_prefix)}]
         full_response = ""
         iteration = 0
         max_iterations = 4  # Limit the number of iterations to prevent infinite loops
@@ -441,19 +603,22 @@ class VertexAILLM(LLMInterface):
                         iteration += 1
                         break
                     else:
+                        self.retry_delay = 1
                         return full_response
 
                 except Exception as e:
                     if attempt < self.max_retries - 1:
-                        print(f"Error occurred: {str(e)}. Retrying in {self.retry_delay} seconds...")
-                        time.sleep(self.retry_delay)
-                        if self.retry_delay < 64:
-                            self.retry_delay *= 2  # Exponential backoff
+                        wait_time = retry_after_seconds(e)
+                        if wait_time is None:
+                            self.retry_delay = decorrelated_jitter(self.retry_delay, 1, 64)
+                            wait_time = self.retry_delay
+                        print(f"Error occurred: {str(e)}. Retrying in {wait_time:.1f} seconds...")
+                        time.sleep(wait_time)
                     else:
                         print(f"Max retries reached. Error: {str(e)}")
                         user_input = input("Do you want to try again? (yes/no): ").lower()
                         if user_input == 'yes':
-                            self.retry_delay = 32  # Reset delay
+                            self.retry_delay = 1  # Reset delay
                             continue
                         else:
                             raise
@@ -474,7 +639,7 @@ class VertexAILLM(LLMInterface):
     
 def get_llm_client(provider: str = "anthropic", model: Optional[str] = None) -> LLMInterface:
     if provider == "anthropic":
-        return AnthropicLLM(anthropic.Anthropic(api_key=API_KEY))
+        return AnthropicLLM(anthropic.Anthropic(api_key=API_KEY, http_client=build_http_client()))
     elif provider == "vertex_ai":
         try:
             from google.auth import default
@@ -486,15 +651,7 @@ def get_llm_client(provider: str = "anthropic", model: Optional[str] = None) ->
             print("pip install --upgrade google-auth google-auth-oauthlib google-auth-httplib2 google-cloud-aiplatform")
             sys.exit(1)
 
-        # Set up Google Cloud credentials
-        credentials, project = default()
-        if not credentials.valid:
-            if credentials.expired and credentials.refresh_token:
-                credentials.refresh(Request())
-            else:
-                raise ValueError("Invalid Google Cloud credentials. Please run 'gcloud auth application-default login'")
-
-        # Set up Google Cloud credentials
+        # Set up Google Cloud credentials once and hand them to the client
         try:
             credentials, project = default()
             if not credentials.valid:
@@ -511,7 +668,7 @@ def get_llm_client(provider: str = "anthropic", model: Optional[str] = None) ->
         #project_id = "devlm-435701"
         project_id = PROJECT_ID
         region = REGION
-        return VertexAILLM(project_id, region, model)
+        return VertexAILLM(project_id, region, model, credentials=credentials)
     elif provider == "openai":
         import os
         if not API_KEY:
@@ -541,10 +698,20 @@ PROJECT_STRUCTURE_FILE = os.path.join(DEVLM_FOLDER, "project_structure.json")
 DEBUG_PROMPT_FOLDER = os.path.join(DEVLM_FOLDER + "/debug/prompts/")
 TASK = None
 WRITE_MODE = 'diff'
+PROJECT_ROOT = None  # Resolved in main() once the working directory is set
 MAX_FILE_LENGTH = 20000
+GENERATE_MAX_WORKERS = 8  # Concurrent LLM requests when generating file content
+FILE_READ_MAX_WORKERS = 8  # Concurrent reads for INSPECT/READ actions
+BRIEF_BATCH_MAX_FILES = 5  # Files whose technical brief entries are requested in one prompt
+BRIEF_BATCH_FILE_MAX_CHARS = 4 * 1024  # Larger files get a brief request of their own
+BRIEF_CONTEXT_MAX_CHARS = 32 * 1024  # Rendered brief context above which sibling todos are clipped
+BRIEF_CONTEXT_TODO_CHARS = 200  # Characters kept of each sibling function's todo when clipping
+INSPECT_HEAD_LENGTH = 32 * 1024  # Characters kept from the start of an inspected file
+INSPECT_TAIL_LENGTH = 8 * 1024  # Characters kept from the end of an inspected file
+RESPONSE_CACHE_FOLDER = os.path.join(DEVLM_FOLDER, "cache")
 
 # Update the COMMAND_HISTORY_FILE and HISTORY_BRIEF_FILE
-COMMAND_HISTORY_FILE = os.path.join(DEVLM_FOLDER+ "/actions", f"action_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+COMMAND_HISTORY_FILE = os.path.join(DEVLM_FOLDER+ "/actions", f"action_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
 HISTORY_BRIEF_FILE = os.path.join(DEVLM_FOLDER+ "/briefs", f"history_brief_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
 
 def wait_until_midnight():
@@ -560,20 +727,17 @@ def handle_low_credit_balance():
     input("Press Enter when you have added credits to continue, or Ctrl+C to exit...")
 
 def get_last_processed_file():
-    if os.path.exists(TECHNICAL_BRIEF_FILE):
-        with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-            brief = json.load(f)
-        last_processed = None
-        last_iteration = 0
-        for dir_entry in brief["directories"]:
-            for file_entry in dir_entry["files"]:
-                if file_entry.get("last_updated_iteration", 0) > last_iteration:
-                    last_processed = os.path.join(dir_entry["path"].lstrip('/'), file_entry["name"])
-                    last_iteration = file_entry["last_updated_iteration"]
-        return last_processed
-    return None
-
-from functools import wraps
+    try:
+        brief = read_json_file(TECHNICAL_BRIEF_FILE)
+    except FileNotFoundError:
+        return None
+    last_processed = None
+    last_iteration = 0
+    for file_path, file_entry in build_file_index(brief["directories"]).items():
+        if file_entry.get("last_updated_iteration", 0) > last_iteration:
+            last_processed = file_path
+            last_iteration = file_entry["last_updated_iteration"]
+    return last_processed
 
 def retry_on_overload(max_retries=3, initial_delay=1, backoff_factor=2):
     def decorator(func):
@@ -596,31 +760,64 @@ def retry_on_overload(max_retries=3, initial_delay=1, backoff_factor=2):
         return wrapper
     return decorator
 
+parsed_project_structure_cache = {"key": None, "structure": None, "json": None}
+
 def get_project_structure():
+    # The parsed file is reused until its mtime or size changes; callers must not mutate it
     structure_file = os.path.join(DEVLM_FOLDER, "project_structure.json")
-    if os.path.exists(structure_file):
-        with open(structure_file, "r") as f:
-            return json.load(f)
-    else:
+    try:
+        stat = os.stat(structure_file)
+    except FileNotFoundError:
         return {
             "": []
         }
-
-def update_directory_summary(brief, directory_path):
-    path_parts = directory_path.split(os.sep)
-    current_dir = brief["directories"]
-    for part in path_parts:
-        if part:
-            current_dir = current_dir["directories"][part]
+    key = (stat.st_mtime_ns, stat.st_size)
+    if parsed_project_structure_cache["key"] != key:
+        parsed_project_structure_cache["structure"] = read_json_file(structure_file)
+        parsed_project_structure_cache["json"] = None
+        parsed_project_structure_cache["key"] = key
+    return parsed_project_structure_cache["structure"]
+
+def get_project_structure_json():
+    # get_project_structure rendered for prompts, rendered once per version of the file
+    structure = get_project_structure()
+    if structure is not parsed_project_structure_cache["structure"]:
+        return pretty_json(structure)
+    if parsed_project_structure_cache["json"] is None:
+        parsed_project_structure_cache["json"] = pretty_json(structure)
+    return parsed_project_structure_cache["json"]
+
+# Per-file progress fields that change every iteration without changing what a
+# directory contains; leaving them out of summary prompts lets unchanged
+# directories hit the response cache
+BRIEF_BOOKKEEPING_KEYS = frozenset(["status", "last_updated_iteration", "test_status"])
+
+def summary_view(entry):
+    if isinstance(entry, dict):
+        # Only file entries (which carry a "name") are filtered; other dicts are keyed by directory name
+        skipped = BRIEF_BOOKKEEPING_KEYS if "name" in entry else ()
+        return {key: summary_view(value) for key, value in entry.items() if key not in skipped}
+    if isinstance(entry, list):
+        return [summary_view(item) for item in entry]
+    return entry
+
+def build_directory_summary_prompt(brief, directory_path, current_dir=None):
+    # Returns None until all files and subdirectories of the directory are processed.
+    # current_dir, if the caller already resolved the directory's entry, skips the walk.
+    if current_dir is None:
+        current_dir = brief["directories"]
+        for part in directory_path.split(os.sep):
+            if part:
+                current_dir = current_dir["directories"][part]
 
     # Check if all files and subdirectories are processed
     all_processed = all(f["status"] in ["done", "in_progress"] for f in current_dir["files"]) and \
                     all(subdir in brief["directory_summaries"] for subdir in current_dir["directories"])
 
     if all_processed:
-        directory_summary_prompt = f"""Please provide a concise summary of the following directory based on its files, functions, and subdirectories:
+        return f"""Please provide a concise summary of the following directory based on its files, functions, and subdirectories:
 
-{json.dumps(current_dir, indent=2)}
+{pretty_json(summary_view(current_dir))}
 
 The summary should be a brief overview of the directory's purpose and main components. It should be useful for an AI when updating or creating new files in this directory or its subdirectories. Include key information about:
 
@@ -634,20 +831,140 @@ If this directory only contains subdirectories, focus on the overall structure a
 
 Limit your response to 200 words.
 """
-        directory_summary = llm_client.generate_response(directory_summary_prompt, 2000)
-        brief["directory_summaries"][directory_path] = directory_summary.strip()
+    return None
+
+def summary_prompt_digest(brief, summary_key, prompt):
+    """
+    Return the digest of a directory's summary prompt, or None if the stored
+    summary was generated from this exact prompt and can be kept. Digests are
+    kept in brief["directory_summary_hashes"] so this holds across runs.
+    """
+    digest = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest()
+    if (brief.get("directory_summary_hashes", {}).get(summary_key) == digest
+            and summary_key in brief["directory_summaries"]):
+        return None
+    return digest
+
+def store_directory_summary(brief, summary_key, summary, digest):
+    brief["directory_summaries"][summary_key] = summary.strip()
+    brief.setdefault("directory_summary_hashes", {})[summary_key] = digest
+
+def update_directory_summary(brief, directory_path):
+    # Resolve the directory and its ancestors in one walk from the root, then
+    # summarise from the directory upwards until one isn't ready or is unchanged
+    ancestors = []
+    current_dir = brief["directories"]
+    current_path = ""
+    for part in directory_path.split(os.sep):
+        if part:
+            current_dir = current_dir["directories"][part]
+            current_path = os.path.join(current_path, part)
+            ancestors.append((current_path, current_dir))
+
+    for current_path, current_dir in reversed(ancestors):
+        directory_summary_prompt = build_directory_summary_prompt(brief, current_path, current_dir)
+        if directory_summary_prompt is None:
+            return
+        digest = summary_prompt_digest(brief, current_path, directory_summary_prompt)
+        if digest is None:
+            return
+        directory_summary = generate_cached_response(llm_client, directory_summary_prompt, 2000)
+        store_directory_summary(brief, current_path, directory_summary, digest)
+
+def update_directory_summaries(brief, directory_paths):
+    """
+    Summarise each of directory_paths ('' for the root) and their parents once,
+    deepest first. Directories at the same depth don't depend on each other, so
+    their summary requests run concurrently.
+    """
+    pending = set(directory_paths)
+    if "" in pending:
+        pending.discard("")
+        update_root_directory_summary(brief)
+    while pending:
+        # Separator counts give the depth without splitting every path
+        depth = max(path.count(os.sep) for path in pending)
+        level = [path for path in pending if path.count(os.sep) == depth]
+        pending.difference_update(level)
+        prompts = {path: build_directory_summary_prompt(brief, path) for path in level}
+        # Directories whose prompt is unchanged keep their summary, and so do their parents
+        digests = {path: summary_prompt_digest(brief, path, prompt) for path, prompt in prompts.items() if prompt is not None}
+        prompts = {path: prompts[path] for path, digest in digests.items() if digest is not None}
+        if not prompts:
+            continue
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(GENERATE_MAX_WORKERS, len(prompts))) as executor:
+            futures = {executor.submit(generate_cached_response, llm_client, prompt, 2000): path
+                       for path, prompt in prompts.items()}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    store_directory_summary(brief, path, future.result(), digests[path])
+                except Exception as e:
+                    print(f"Error generating directory summary for {path}: {str(e)}")
+                    continue
+                parent_dir = os.path.dirname(path)
+                if parent_dir:
+                    pending.add(parent_dir)
+
+TRAILING_COMMA_PATTERN = re.compile(r',(\s*[}\]])')
+
+def repair_json(json_str):
+    # Cheap fixes for the mistakes LLMs most often make in JSON
+    json_str = json_str.replace('\u201c', '"').replace('\u201d', '"')
+    return TRAILING_COMMA_PATTERN.sub(r'\1', json_str)
+
+def parse_llm_json(json_str):
+    # Strict parse first, then after repair_json, and only then the much more
+    # lenient (and slower) JSON5 parser
+    try:
+        return parse_json(json_str)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return parse_json(repair_json(json_str))
+    except json.JSONDecodeError:
+        from pyjson5 import load as json5_load
+        return json5_load(StringIO(json_str))
+
+JSON_CODE_BLOCK_PATTERN = re.compile(r'```(?:json)?\n([\s\S]*?)\n```')
 
-        # Recursively update parent directory summaries
-        parent_dir = os.path.dirname(directory_path)
-        if parent_dir:
-            update_directory_summary(brief, parent_dir)
+def find_json_object(text):
+    """
+    Return the span (start, end) of the first balanced {...} object in text,
+    or None. A single pass that tracks brace depth outside of strings, so
+    malformed responses can't cause regex backtracking.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return start, index + 1
+    return None
 
 def review_project_structure(project_summary):
     current_structure = get_project_structure()
     prompt = f"""As an experienced software developer, please review and suggest improvements to the following project structure for our LLM-based Software Developer Project. Consider best practices, scalability, and maintainability. Suggest a new structure if needed, explaining your reasoning.
 
 Current Project Structure:
-{json.dumps(current_structure, indent=2)}
+{pretty_json(current_structure)}
 
 Project Summary:
 {project_summary}
@@ -668,10 +985,10 @@ Also, provide a brief explanation of your suggested changes.
     try:
         response_text = llm_client.generate_response(prompt, 4000)
         
-        json_match = re.search(r'\{[\s\S]*\}', response_text)
-        if json_match:
-            suggested_structure = json.loads(json_match.group(0))
-            explanation = response_text.split(json_match.group(0))[-1].strip()
+        json_span = find_json_object(response_text)
+        if json_span:
+            suggested_structure = parse_json(response_text[json_span[0]:json_span[1]])
+            explanation = response_text[json_span[1]:].strip()
             return suggested_structure, explanation
         else:
             raise ValueError("No JSON object found in the response")
@@ -698,16 +1015,25 @@ def create_project_structure(structure):
         else:
             create_files(directory, items)
 
-def remove_old_structure(preserve_files):
-    for root, dirs, files in os.walk(".", topdown=False):
-        for name in files:
-            if name not in preserve_files:
-                os.remove(os.path.join(root, name))
-        for name in dirs:
-            try:
-                os.rmdir(os.path.join(root, name))
-            except OSError:
-                pass  # Directory not empty, will be removed in next iterations
+def remove_old_structure(preserve_files, root="."):
+    # Delete everything under root except files named in preserve_files, in a single
+    # os.scandir pass. Returns True if anything under root was kept.
+    kept = False
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if remove_old_structure(preserve_files, entry.path):
+                    kept = True
+                    continue
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    kept = True
+            elif entry.name in preserve_files:
+                kept = True
+            else:
+                os.remove(entry.path)
+    return kept
 
 def initialize_technical_brief(structure):
     if os.path.exists(TECHNICAL_BRIEF_FILE):
@@ -755,15 +1081,11 @@ def initialize_technical_brief(structure):
         else:
             brief["directories"]["directories"][name] = process_directory(content)
 
-    with open(TECHNICAL_BRIEF_FILE, 'w') as f:
-        json.dump(brief, f, indent=4)
-
     save_technical_brief(brief)
     return brief
 
 def check_progress(structure):
-    with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-        brief = json.load(f)
+    brief = read_json_file(TECHNICAL_BRIEF_FILE)
     
     def update_directory_progress(brief_dir, structure_dir, current_path=""):
         for file_name, file_info in structure_dir.items():
@@ -790,23 +1112,13 @@ def check_progress(structure):
     
     update_directory_progress(brief["directories"], structure)
     
-    with open(TECHNICAL_BRIEF_FILE, 'w') as f:
-        json.dump(brief, f, indent=4)
+    write_json_file(TECHNICAL_BRIEF_FILE, brief)
     
     return brief
 
-def update_technical_brief(file_path, content, iteration, mode="generate", test_info=None):
-    with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-        brief = json.load(f)
-    
-    file_entry = find_file_entry(brief["directories"], file_path)
-    
-    if file_entry is None:
-        file_entry = {"name": os.path.basename(file_path), "functions": [], "status": "not_started"}
-        update_file_entry(brief["directories"], file_path, file_entry)
-
-    if mode == "generate":
-        prompt = f"""Based on the following file content, please generate a complete and valid JSON object for the technical brief of the file {os.path.basename(file_path)}. The brief should include a summary of the file's purpose and a list of functions with their inputs, outputs, and a brief summary. Also, include a "todo" field for each function if there's anything that needs to be completed or improved.
+def generate_file_brief(file_path, content):
+    # Ask the LLM for a file's technical brief entry; raises if the response can't be parsed
+    prompt = f"""Based on the following file content, please generate a complete and valid JSON object for the technical brief of the file {os.path.basename(file_path)}. The brief should include a summary of the file's purpose and a list of functions with their inputs, outputs, and a brief summary. Also, include a "todo" field for each function if there's anything that needs to be completed or improved.
 
 File content:
 {content}
@@ -832,19 +1144,108 @@ Output format:
 Important: Ensure that the JSON is complete, properly formatted, and enclosed in triple backticks. Do not include any text outside the JSON object.
 """
 
-        try:
-            response_text = llm_client.generate_response(prompt, 4000)
-            
-            json_match = re.search(r'```(?:json)?\n([\s\S]*?)\n```', response_text)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = response_text
+    return generate_cached_response(llm_client, prompt, 4000, parse=parse_brief_response)
+
+def parse_brief_response(response_text):
+    json_match = JSON_CODE_BLOCK_PATTERN.search(response_text)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        json_str = response_text
+
+    return parse_llm_json(json_str)
+
+def generate_file_briefs(files):
+    """
+    Generate technical brief entries for several small files with one prompt.
+
+    files is a list of (file_path, content). Returns {file_path: brief_content}
+    for the files the response covered; callers fall back to generate_file_brief
+    for the rest.
+    """
+    if len(files) == 1:
+        file_path, content = files[0]
+        return {file_path: generate_file_brief(file_path, content)}
+
+    file_sections = "\n\n".join(
+        f"File {number}: {os.path.basename(file_path)}\n{content}"
+        for number, (file_path, content) in enumerate(files, 1)
+    )
+    prompt = f"""Based on the following {len(files)} files, please generate a complete and valid JSON array with the technical brief of each file, in the same order as the files are listed. Each brief should include a summary of the file's purpose and a list of functions with their inputs, outputs, and a brief summary. Also, include a "todo" field for each function if there's anything that needs to be completed or improved.
+
+{file_sections}
 
+Output format:
+[
+    {{
+        "name": "file name as listed above",
+        "summary": "File summary",
+        "status": "in_progress",
+        "functions": [
+            {{
+                "name": "function_name",
+                "inputs": ["param1", "param2"],
+                "input_types": ["type1", "type2"],
+                "outputs": ["result"],
+                "output_types": ["result_type"],
+                "summary": "Brief description of the function",
+                "todo": "Optional: any additional information or tasks to be completed"
+            }}
+        ]
+    }}
+]
+
+Important: Ensure that the JSON is complete, properly formatted, and enclosed in triple backticks. Do not include any text outside the JSON array.
+"""
+
+    briefs = generate_cached_response(llm_client, prompt, 8000, parse=parse_brief_response)
+
+    # Only keep entries that line up with the file they were requested for
+    brief_contents = {}
+    if isinstance(briefs, list):
+        for (file_path, _), brief_content in zip(files, briefs):
+            if isinstance(brief_content, dict) and brief_content.get("name") == os.path.basename(file_path):
+                brief_contents[file_path] = brief_content
+    return brief_contents
+
+def generate_file_briefs_batched(files):
+    # Group small files BRIEF_BATCH_MAX_FILES at a time and run the groups concurrently
+    groups = [files[i:i + BRIEF_BATCH_MAX_FILES] for i in range(0, len(files), BRIEF_BATCH_MAX_FILES)]
+    brief_contents = {}
+    if not groups:
+        return brief_contents
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(GENERATE_MAX_WORKERS, len(groups))) as executor:
+        futures = [executor.submit(generate_file_briefs, group) for group in groups]
+        for future in concurrent.futures.as_completed(futures):
             try:
-                brief_content = json.loads(json_str)
-            except json.JSONDecodeError:
-                brief_content = json5_load(StringIO(json_str))
+                brief_contents.update(future.result())
+            except Exception as e:
+                # The files of this group get individual requests in update_technical_brief
+                print(f"Error generating batched technical briefs: {str(e)}")
+    return brief_contents
+
+def update_technical_brief(file_path, content, iteration, mode="generate", test_info=None, brief=None, brief_content=None, file_entry=None, summary_directories=None):
+    # When the caller passes its in-memory brief, it is updated in place and the
+    # caller is responsible for saving it; otherwise the brief is loaded and saved here.
+    # brief_content, if already generated with generate_file_brief, skips that LLM call.
+    # file_entry, if the caller already holds the brief's entry for file_path, skips the lookup.
+    # summary_directories, if given, collects the file's directory so the caller can
+    # summarise it once with update_directory_summaries instead of after every file.
+    save = brief is None
+    if save:
+        brief = read_json_file(TECHNICAL_BRIEF_FILE)
+    
+    if file_entry is None:
+        file_entry = find_file_entry(brief["directories"], file_path)
+    
+    if file_entry is None:
+        file_entry = {"name": os.path.basename(file_path), "functions": [], "status": "not_started"}
+        update_file_entry(brief["directories"], file_path, file_entry)
+
+    if mode == "generate":
+        try:
+            if brief_content is None:
+                brief_content = generate_file_brief(file_path, content)
 
             file_entry.update(brief_content)
             file_entry["last_updated_iteration"] = iteration
@@ -881,45 +1282,43 @@ Important: Ensure that the JSON is complete, properly formatted, and enclosed in
         file_entry["last_updated_iteration"] = iteration
         file_entry["status"] = "tested"
 
-    if len(file_path.split(os.sep)) == 1:
+    if summary_directories is not None:
+        summary_directories.add(os.path.dirname(file_path))
+    elif len(file_path.split(os.sep)) == 1:
         update_root_directory_summary(brief)
     else:
         update_directory_summary(brief, os.path.dirname(file_path))
 
-    save_technical_brief(brief)
+    if save:
+        save_technical_brief(brief)
 
     return brief
 
 def save_technical_brief(brief):
+    # os.replace is atomic, so readers see either the old or the new brief
     temp_file = TECHNICAL_BRIEF_FILE + ".temp"
-    with open(temp_file, 'w') as f:
-        json.dump(brief, f, indent=4)
+    write_json_file(temp_file, brief)
     os.replace(temp_file, TECHNICAL_BRIEF_FILE)
     print(f"Technical brief saved to {TECHNICAL_BRIEF_FILE}")
 
-    # Verify that the file was actually updated
-    with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-        saved_brief = json.load(f)
-    if saved_brief != brief:
-        print("Warning: The saved technical brief does not match the in-memory version.")
-        print("In-memory version:", brief)
-        print("Saved version:", saved_brief)
-
 def update_root_directory_summary(brief):
     root_files = brief["directories"].get("files", [])
     
     prompt = f"""Please provide a concise summary of the root directory based on the following files:
 
-{json.dumps(root_files, indent=2)}
+{pretty_json(summary_view(root_files))}
 
 The summary should focus on the purpose and content of these root-level files, their relationships, and their role in the project structure. Do not include information about subdirectories, as they have their own summaries.
 
 Limit your response to 200 words.
 """
 
+    digest = summary_prompt_digest(brief, ".", prompt)
+    if digest is None:
+        return
     try:
-        root_summary = llm_client.generate_response(prompt, 2000)
-        brief["directory_summaries"]["."] = root_summary.strip()
+        root_summary = generate_cached_response(llm_client, prompt, 2000)
+        store_directory_summary(brief, ".", root_summary, digest)
     except Exception as e:
         print(f"Error generating root directory summary: {str(e)}")
         brief["directory_summaries"]["."] = "Error generating root directory summary"
@@ -940,43 +1339,107 @@ def get_context_for_file(file_path, brief):
         }
         return context
 
-    # Build up the context with relevant directory summaries
-    current_path = ""
+    # Build up the context with relevant directory summaries; each ancestor's
+    # path is a prefix of file_path, so it is sliced out rather than re-joined
+    directory_summaries = brief.get("directory_summaries", {})
+    end = -1
     for part in path_parts[:-1]:
-        current_path = os.path.join(current_path, part)
-        if current_path in brief.get("directory_summaries", {}):
-            context["directory_summaries"][current_path] = brief["directory_summaries"][current_path]
+        end += len(part) + 1
+        current_path = file_path[:end]
+        if current_path in directory_summaries:
+            context["directory_summaries"][current_path] = directory_summaries[current_path]
         if part in current_dir.get("directories", {}):
             current_dir = current_dir["directories"][part]
     
     context["current_directory"] = current_dir
     return context
 
-def get_file_content(file_path, project_summary, technical_brief, previous_content="", iteration=1, max_iterations=5):
-    prompt = f"""Based on the following project summary, technical brief, and previous content, please generate or update the content for the file {file_path}. Include necessary imports, basic structure, and functions or classes as appropriate. Ensure the generated content is consistent with the existing project structure and previously generated files. Focus on completing the todos for each function.
+def trim_context_todos(context, file_name):
+    # Clip the todo notes of sibling files' functions; the file being generated
+    # keeps its own in full. The brief itself is left untouched.
+    def clip_todo(func):
+        todo = func.get("todo") if isinstance(func, dict) else None
+        if isinstance(todo, str) and len(todo) > BRIEF_CONTEXT_TODO_CHARS:
+            return {**func, "todo": todo[:BRIEF_CONTEXT_TODO_CHARS] + "..."}
+        return func
+
+    files = []
+    for entry in context["current_directory"].get("files", []):
+        if isinstance(entry, dict) and entry.get("name") != file_name and isinstance(entry.get("functions"), list):
+            entry = {**entry, "functions": [clip_todo(func) for func in entry["functions"]]}
+        files.append(entry)
+    return {**context, "current_directory": {**context["current_directory"], "files": files}}
+
+def response_cache_path(llm_client, prompt, max_tokens):
+    key = hashlib.sha256(f"{type(llm_client).__name__}\0{getattr(llm_client, 'model', '')}\0{max_tokens}\0{prompt}".encode('utf-8')).hexdigest()
+    # Two-character fan-out directories keep any one directory small
+    return os.path.join(RESPONSE_CACHE_FOLDER, key[:2], key[2:])
+
+def generate_cached_response(llm_client, prompt, max_tokens, cached_prefix=None, parse=None):
+    # Responses are stored on disk by prompt hash, so re-running generation with
+    # byte-identical inputs doesn't repeat the LLM call. parse, if given, turns the
+    # response into the returned result; a response is only stored once it parses,
+    # so a malformed one isn't replayed on every later run
+    if parse is None:
+        parse = lambda response: response
+    if not RESPONSE_CACHE_ENABLED:
+        return parse(llm_client.generate_response(prompt, max_tokens, cached_prefix))
+    cache_path = response_cache_path(llm_client, prompt, max_tokens)
+    try:
+        return parse(read_file(cache_path))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Ignoring unusable cached response {cache_path}: {str(e)}")
+    response = llm_client.generate_response(prompt, max_tokens, cached_prefix)
+    result = parse(response)
+    if response:
+        store_cached_response(cache_path, response)
+    return result
 
-This is iteration {iteration} out of a maximum of {max_iterations}. You will have multiple iterations to complete this file, so you can focus on improving specific parts in each iteration.
+def store_cached_response(cache_path, response):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(response)
+    os.replace(temp_path, cache_path)
+
+def build_file_content_prefix(project_summary):
+    # The part of every file's content prompt that is the same for all files in a
+    # run. It leads the prompt so it can be sent as a cacheable prefix.
+    return f"""You are generating or updating the content of the files in this project, one file at a time. Include necessary imports, basic structure, and functions or classes as appropriate. Ensure the generated content is consistent with the existing project structure and previously generated files. Focus on completing the todos for each function.
 
 Project Summary:
 {project_summary}
 
+Project Structure:
+{get_project_structure_json()}
+"""
+
+def build_file_content_prompt(file_path, project_summary, technical_brief, previous_content="", iteration=1, max_iterations=5):
+    # technical_brief may be passed already rendered, so callers can share one rendering
+    if not isinstance(technical_brief, str):
+        technical_brief = pretty_json(technical_brief)
+    return build_file_content_prefix(project_summary) + f"""
+Based on the project summary above and the following technical brief and previous content, please generate or update the content for the file {file_path}.
+
+This is iteration {iteration} out of a maximum of {max_iterations}. You will have multiple iterations to complete this file, so you can focus on improving specific parts in each iteration.
+
 Technical Brief:
-{json.dumps(technical_brief, indent=2)}
+{technical_brief}
 
 Previous Content:
 {previous_content}
 
-Project Structure:
-{json.dumps(get_project_structure(), indent=2)}
-
 Please provide the complete content for the file {file_path}, addressing any todos and improving the code as needed. Remember to correctly reference other packages, imports. Your output should be valid content for that file type, without any explanations or comments outside the content itself. If you need to include any explanations, please do so as comments within the code. Remember that you are directly writing to the file.
 
 For configuration files, please use placeholder values that the user can easily identify and replace later.
 """
 
+def get_file_content(file_path, project_summary, technical_brief, previous_content="", iteration=1, max_iterations=5):
+    prompt = build_file_content_prompt(file_path, project_summary, technical_brief, previous_content, iteration, max_iterations)
+
     try:
-        response_text = llm_client.generate_response(prompt, 4000)
-        
         # # Check if the response starts with a code block
         # if response_text.strip().startswith("```"):
         #     # Extract code from the code block
@@ -988,74 +1451,133 @@ For configuration files, please use placeholder values that the user can easily
         # return response_text.strip()
 
         # Extract code from the response
-        code_content = extract_content(response_text, file_path)
-        
-        return code_content
+        return generate_cached_response(llm_client, prompt, 4000, cached_prefix=build_file_content_prefix(project_summary),
+                                        parse=lambda response_text: extract_complete_content(response_text, file_path))
     except Exception as e:
         print(f"Error generating content for {file_path}: {str(e)}")
         return None
 
+def iter_brief_directories(directory, current_path=""):
+    """
+    Yield (path, directory_entry) for every directory in the technical brief,
+    starting with the root directory entry.
+    """
+    yield current_path, directory
+    for name, subdir in directory.get("directories", {}).items():
+        yield from iter_brief_directories(subdir, os.path.join(current_path, name))
+
+def build_file_index(directories):
+    # Map each file path in the brief to its entry for O(1) lookups
+    return {os.path.join(dir_path, file_entry["name"]): file_entry
+            for dir_path, dir_entry in iter_brief_directories(directories)
+            for file_entry in dir_entry.get("files", [])}
+
+processed_files_cache = {"mtime": None, "files": {}}
+
 def get_processed_files():
-    if os.path.exists(TECHNICAL_BRIEF_FILE):
-        with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-            brief = json.load(f)
-        processed_files = set()
-        for dir_entry in brief["directories"]:
-            for file_entry in dir_entry["files"]:
-                if file_entry.get("last_updated_iteration", 0) > 0:
-                    processed_files.add(os.path.join(dir_entry["path"].lstrip('/'), file_entry["name"]))
-        return processed_files
-    return set()
+    """
+    Return a dict mapping each processed file path to its st_mtime_ns on disk
+    (None if the file no longer exists). Each directory is listed once with
+    os.scandir instead of stat'ing every file, and the result is reused until
+    the technical brief changes.
+    """
+    try:
+        brief_mtime = os.stat(TECHNICAL_BRIEF_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if processed_files_cache["mtime"] == brief_mtime:
+        return processed_files_cache["files"]
+
+    brief = read_json_file(TECHNICAL_BRIEF_FILE)
+    processed_files = {}
+    for dir_path, dir_entry in iter_brief_directories(brief["directories"]):
+        names = [f["name"] for f in dir_entry.get("files", []) if f.get("last_updated_iteration", 0) > 0]
+        if not names:
+            continue
+        try:
+            with os.scandir(dir_path or '.') as entries:
+                mtimes = {entry.name: entry.stat(follow_symlinks=False).st_mtime_ns for entry in entries}
+        except FileNotFoundError:
+            mtimes = {}
+        for name in names:
+            processed_files[os.path.join(dir_path, name)] = mtimes.get(name)
+
+    processed_files_cache["mtime"] = brief_mtime
+    processed_files_cache["files"] = processed_files
+    return processed_files
 
 def generate_project_structure(root_dir='.'):
     def create_structure(path):
+        # os.scandir yields each entry's type with the listing, so most entries need no extra stat
         structure = {"": []}
-        for item in os.listdir(path):
-            if item == 'node_modules' or item.startswith('.') or item == 'build':
-                continue
-            full_path = os.path.join(path, item)
-            if os.path.isfile(full_path):
-                structure[""].append(item)
-            elif os.path.isdir(full_path):
-                structure[item] = create_structure(full_path)
+        with os.scandir(path) as entries:
+            for entry in entries:
+                item = entry.name
+                if item == 'node_modules' or item.startswith('.') or item == 'build':
+                    continue
+                if entry.is_file():
+                    structure[""].append(item)
+                elif entry.is_dir():
+                    structure[item] = create_structure(entry.path)
         return structure
 
     return create_structure(root_dir)
 
+def collect_file_paths(directory, preserve_files, current_path=""):
+    if isinstance(directory, list):
+        return [os.path.join(current_path, item) for item in directory if isinstance(item, str) and item not in preserve_files]
+    elif isinstance(directory, dict):
+        files = []
+        for subdir, items in directory.items():
+            new_path = os.path.join(current_path, subdir)
+            files.extend(collect_file_paths(items, preserve_files, new_path))
+        return files
+    return []
+
 def save_project_structure(structure):
-    with open(PROJECT_STRUCTURE_FILE, 'w') as f:
-        json.dump(structure, f, indent=2)
+    write_json_file(PROJECT_STRUCTURE_FILE, structure)
 
 def read_project_structure():
-    if os.path.exists(PROJECT_STRUCTURE_FILE):
-        with open(PROJECT_STRUCTURE_FILE, 'r') as f:
-            return json.load(f)
-    return None
+    # Opening directly doubles as the existence check
+    try:
+        return read_json_file(PROJECT_STRUCTURE_FILE)
+    except FileNotFoundError:
+        return None
+
+def is_within_project(file_path):
+    project_root = PROJECT_ROOT or os.path.realpath(os.getcwd())
+    return os.path.commonpath([project_root, os.path.realpath(file_path)]) == project_root
+
+# Leading four bytes of common non-text formats: zip (and jar/docx), PNG, Mach-O, Java class
+BINARY_MAGIC_NUMBERS = frozenset([b'PK\x03\x04', b'\x89PNG', b'\xcf\xfa\xed\xfe', b'\xce\xfa\xed\xfe', b'\xca\xfe\xba\xbe'])
 
 def inspect_file_with_approval(file_path):
-    project_root = os.getcwd()  # Get the current working directory (project root)
-    
-    if not os.path.abspath(file_path).startswith(project_root):
+    if not is_within_project(file_path):
         print(f"Warning: Attempting to access file outside project directory: {file_path}")
         approval = input("Do you approve this action? (yes/no): ").lower().strip()
         if approval != 'yes':
             print("Action not approved. Skipping file inspection.")
             return None
     
+    # One open serves both the magic-number check and the read, instead of
+    # separate exists/isfile stats and a second open in text mode
     try:
-        if os.path.exists(file_path):
-            if os.path.isfile(file_path):
-                with open(file_path, 'rb') as f:
-                    content = f.read(1024)  # Read first 1024 bytes
-                if content.startswith(b'\x7fELF'):
-                    return "This appears to be a binary executable file."
-                else:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        return f.read()
-            elif os.path.isdir(file_path):
-                return f"This is a directory. Contents: {os.listdir(file_path)}"
-        else:
-            return f"File or directory not found: {file_path}"
+        with open(file_path, 'rb') as f:
+            head = f.read(4)
+            if head == b'\x7fELF':
+                return "This appears to be a binary executable file."
+            if head in BINARY_MAGIC_NUMBERS:
+                return "This appears to be a binary file."
+            data = head + f.read()
+        return data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+    except FileNotFoundError:
+        return f"File or directory not found: {file_path}"
+    except IsADirectoryError:
+        # scandir's entries already know their type, so subdirectories are
+        # marked with a trailing slash without a stat per entry
+        with os.scandir(file_path) as entries:
+            contents = [entry.name + '/' if entry.is_dir() else entry.name for entry in entries]
+        return f"This is a directory. Contents: {contents}"
     except Exception as e:
         return f"Error inspecting file: {str(e)}"
 
@@ -1071,15 +1593,26 @@ def wait_for_user():
     input()
     return True
 
+# Last parsed test progress, keyed on the file's (mtime_ns, size); the file is
+# re-read every iteration but only changes when this process saves it
+test_progress_cache = {"key": None, "progress": None}
+
 def load_test_progress():
-    if os.path.exists(TEST_PROGRESS_FILE):
-        with open(TEST_PROGRESS_FILE, 'r') as f:
-            return json.load(f)
-    return {"completed_tests": [], "current_step": None}
+    try:
+        st = os.stat(TEST_PROGRESS_FILE)
+    except FileNotFoundError:
+        return {"completed_tests": [], "current_step": None}
+    key = (st.st_mtime_ns, st.st_size)
+    if test_progress_cache["key"] != key:
+        test_progress_cache["progress"] = read_json_file(TEST_PROGRESS_FILE)
+        test_progress_cache["key"] = key
+    return test_progress_cache["progress"]
 
 def save_test_progress(progress):
-    with open(TEST_PROGRESS_FILE, 'w') as f:
-        json.dump(progress, f, indent=2)
+    write_json_file(TEST_PROGRESS_FILE, progress)
+    st = os.stat(TEST_PROGRESS_FILE)
+    test_progress_cache["key"] = (st.st_mtime_ns, st.st_size)
+    test_progress_cache["progress"] = progress
 
 def update_test_progress(completed_test=None, current_step=None):
     progress = load_test_progress()
@@ -1090,28 +1623,93 @@ def update_test_progress(completed_test=None, current_step=None):
     save_test_progress(progress)
 
 running_processes = []
+# Index of running_processes keyed on get_process_key(cmd) for O(1) lookups
+running_processes_by_key = {}
+
+def register_process(process_info):
+    running_processes.append(process_info)
+    running_processes_by_key[get_process_key(process_info["cmd"])] = process_info
+
+def unregister_process(process_info):
+    if process_info in running_processes:
+        running_processes.remove(process_info)
+    key = get_process_key(process_info["cmd"])
+    if running_processes_by_key.get(key) is process_info:
+        del running_processes_by_key[key]
+        # Fall back to the newest remaining process under the same key
+        for other in reversed(running_processes):
+            if get_process_key(other["cmd"]) == key:
+                running_processes_by_key[key] = other
+                break
+
+def find_process(command):
+    process_key = get_process_key(command)
+    process_info = running_processes_by_key.get(process_key)
+    if process_info is not None:
+        return process_info
+    # Fall back to a substring match so partial commands still resolve
+    for process_info in running_processes:
+        if process_key in process_info["cmd"]:
+            return process_info
+    return None
 
 def check_all_processes():
-    for process_info in running_processes[:]:  # Iterate over a copy of the list
-        status, output = check_process_output(process_info["cmd"])
-        if output:
+    exited = []
+    for process_info in running_processes:
+        output = poll_process_output(process_info)
+        if output is None:
+            print(f"Process '{process_info['cmd']}' has terminated.")
+            exited.append(process_info)
+        elif output:
             print(f"New output from '{process_info['cmd']}':\n{output}")
-        if "has terminated" in status:
-            print(status)
-            # The process will be removed in check_process_output, so we don't need to do it here
+    for process_info in exited:
+        unregister_process(process_info)
 
-def get_running_processes_info():
-    return [{"cmd": p["cmd"]} for p in running_processes]
+def collect_process_tree(pids):
+    # Gather each process and all of its descendants as psutil.Process objects
+    processes = {}
+    for pid in pids:
+        try:
+            parent = psutil.Process(pid)
+            for process in [parent] + parent.children(recursive=True):
+                processes[process.pid] = process
+        except psutil.NoSuchProcess:
+            print(f"Process {pid} no longer exists.")
+    return list(processes.values())
+
+def terminate_processes(processes, timeout=5):
+    # Signal every process first and then wait once for all of them, so the
+    # timeout is paid once per batch instead of once per process
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.NoSuchProcess:
+            pass
+        except psutil.AccessDenied:
+            print(f"Access denied when trying to terminate process {process.pid}.")
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for process in alive:
+        print(f"Process {process.pid} did not terminate within timeout. Forcing termination.")
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    if alive:
+        psutil.wait_procs(alive, timeout=timeout)
 
 # Update the kill_all_processes function
 def kill_all_processes():
+    processes = collect_process_tree([process_info['pid'] for process_info in running_processes])
     for process_info in running_processes:
         try:
             os.killpg(os.getpgid(process_info['process'].pid), signal.SIGTERM)
             print(f"Terminated process group: {process_info['cmd']}")
         except Exception as e:
             print(f"Error terminating process group {process_info['cmd']}: {str(e)}")
+    # Reap the group members and force-kill anything that ignored SIGTERM
+    terminate_processes(processes)
     running_processes.clear()
+    running_processes_by_key.clear()
 
 atexit.register(kill_all_processes)
 
@@ -1126,34 +1724,19 @@ def get_all_child_processes(parent_pid):
         return []
 
 def check_and_terminate_existing_process(command):
-    global running_processes
-    
-    for process_info in running_processes:
-        if process_info['cmd'] == command:
-            pids_to_terminate = process_info['child_pids'] + [process_info['pid']]
-            for pid in pids_to_terminate:
-                try:
-                    process = psutil.Process(pid)
-                    print(f"Terminating process with PID: {pid}")
-                    process.terminate()
-                    
-                    try:
-                        process.wait(timeout=5)
-                    except psutil.TimeoutExpired:
-                        print(f"Process {pid} did not terminate within timeout. Forcing termination.")
-                        process.kill()
-                    
-                    print(f"Process {pid} has been terminated.")
-                except psutil.NoSuchProcess:
-                    print(f"Process {pid} no longer exists.")
-                except psutil.AccessDenied:
-                    print(f"Access denied when trying to terminate process {pid}.")
-            
-            # Remove the terminated process from the list
-            running_processes = [p for p in running_processes if p['pid'] != process_info['pid']]
-            time.sleep(2)  # Wait for 2 seconds to ensure resources are released
-            return True
-    
+    # Several processes can share a key (e.g. the same command in different
+    # directories), so look for the exact command rather than the key's latest
+    process_info = next((p for p in running_processes if p['cmd'] == command), None)
+    if process_info is not None:
+        pids_to_terminate = process_info['child_pids'] + [process_info['pid']]
+        print(f"Terminating processes with PIDs: {pids_to_terminate}")
+        terminate_processes(collect_process_tree(pids_to_terminate))
+        
+        # Remove the terminated process from the list
+        unregister_process(process_info)
+        time.sleep(2)  # Wait for 2 seconds to ensure resources are released
+        return True
+
     return False
 
 def parse_compound_command(command):
@@ -1175,34 +1758,138 @@ def get_process_key(command):
         return run_part.split()[-1]
     return run_part
 
+PROCESS_OUTPUT_MAX_LINES = 2000  # Lines of unread output kept per background process
+PROCESS_OUTPUT_PROMPT_BUDGET = 16 * 1024  # Characters of process output included in one prompt
+PROCESS_STARTUP_TIMEOUT = 5  # Longest wait in seconds for a new background process's initial output
+PROCESS_STARTUP_QUIET = 0.5  # Seconds without new output after which the initial output is taken as complete
+
+def drain_output_buffer(output_buffer, max_chars=None):
+    # Pop the buffered lines and join once instead of repeatedly
+    # concatenating, which is quadratic for chatty processes
+    chunks = []
+    while True:
+        try:
+            chunks.append(output_buffer.popleft())
+        except IndexError:
+            break
+    if max_chars is None:
+        return ''.join(chunks)
+    # Only join the trailing lines that make it into the last max_chars
+    start = len(chunks)
+    size = 0
+    while start > 0 and size < max_chars:
+        start -= 1
+        size += len(chunks[start])
+    return ''.join(chunks[start:])[-max_chars:]
+
+@lru_cache(maxsize=256)
+def split_command(command):
+    # Commands without quotes or escapes split the same way with str.split,
+    # which avoids the pure-Python shlex tokenizer
+    if "'" not in command and '"' not in command and '\\' not in command:
+        return tuple(command.split())
+    return tuple(shlex.split(command))
+
+# Pipes of all background processes are watched by one shared reader thread,
+# started with the first process
+process_output_selector = selectors.DefaultSelector()
+process_output_lock = threading.Lock()
+process_output_thread = None
+
+def watch_process_output(process, output_buffer):
+    # Returns a dict whose "bytes" count of output read from the process only
+    # ever goes up, unlike the length of output_buffer, which is capped and drained
+    global process_output_thread
+    output_progress = {"bytes": 0}
+    with process_output_lock:
+        for pipe in (process.stdout, process.stderr):
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            process_output_selector.register(pipe, selectors.EVENT_READ, (decoder, output_buffer, output_progress))
+        if process_output_thread is None:
+            process_output_thread = threading.Thread(target=pump_process_output, daemon=True)
+            process_output_thread.start()
+    return output_progress
+
+def pump_process_output():
+    # Read whatever is available on any watched pipe into its process's output
+    # buffer. The timeout bounds how long a newly registered pipe can wait on
+    # selectors that don't pick up registrations made during a select.
+    global process_output_thread
+    try:
+        while True:
+            try:
+                ready = process_output_selector.select(timeout=0.1)
+            except (OSError, ValueError) as e:
+                # A pipe was closed elsewhere while still registered; drop it and carry on
+                print(f"Error watching process output: {str(e)}")
+                drop_closed_output_pipes()
+                continue
+            for key, _ in ready:
+                decoder, output_buffer, output_progress = key.data
+                try:
+                    data = os.read(key.fd, 65536)
+                except OSError as e:
+                    print(f"Error reading process output: {str(e)}")
+                    data = b""
+                if not data:
+                    with process_output_lock:
+                        process_output_selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    continue
+                output_progress["bytes"] += len(data)
+                text = decoder.decode(data).replace('\r\n', '\n')
+                output_buffer.extend(text.splitlines(keepends=True))
+    finally:
+        # Let the next watch_process_output start a fresh reader if this one dies
+        with process_output_lock:
+            process_output_thread = None
+
+def drop_closed_output_pipes():
+    with process_output_lock:
+        for key in list(process_output_selector.get_map().values()):
+            if key.fileobj.closed:
+                process_output_selector.unregister(key.fileobj)
+
+def wait_for_initial_output(process, output_progress):
+    # Return once the process has printed something and gone quiet, or exited
+    # and gone quiet, instead of always sleeping for the full timeout
+    deadline = time.monotonic() + PROCESS_STARTUP_TIMEOUT
+    seen = 0
+    last_change = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if output_progress["bytes"] != seen:
+            seen = output_progress["bytes"]
+            last_change = now
+        elif (seen or process.poll() is not None) and now - last_change >= PROCESS_STARTUP_QUIET:
+            return
+        if now >= deadline:
+            return
+        time.sleep(0.05)
+
 def run_continuous_process(command):
     check_and_terminate_existing_process(command)
 
     cd_part, run_part = parse_compound_command(command)
     cwd = os.getcwd()
     
-    if cd_part:
-        target_dir = cd_part.split(None, 1)[1]
-        os.chdir(target_dir)
+    # Run the process in the target directory instead of changing ours
+    target_dir = cd_part.split(None, 1)[1] if cd_part else None
     
     run_command = run_part if run_part else command
 
     try:
-        # Start the new process in its own process group
-        process = subprocess.Popen(shlex.split(run_command), stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-                                   universal_newlines=True, preexec_fn=os.setpgrp)
-        output_queue = queue.Queue()
-        
-        def enqueue_output(out, queue):
-            for line in iter(out.readline, ''):
-                queue.put(line)
-            out.close()
-        
-        threading.Thread(target=enqueue_output, args=(process.stdout, output_queue), daemon=True).start()
-        threading.Thread(target=enqueue_output, args=(process.stderr, output_queue), daemon=True).start()
+        # Start the new process in its own session (and so its own process group).
+        # Unlike preexec_fn, start_new_session doesn't force subprocess onto its
+        # slow fork path. The pipes are read with os.read, so they're unbuffered.
+        process = subprocess.Popen(split_command(run_command), stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
+                                   bufsize=0, start_new_session=True, cwd=target_dir)
+        # Ring buffer of unread output: a process nobody checks on can't grow it without bound
+        output_buffer = deque(maxlen=PROCESS_OUTPUT_MAX_LINES)
+        output_progress = watch_process_output(process, output_buffer)
         
         # Wait for the process to start and get all child processes
-        time.sleep(5)
+        wait_for_initial_output(process, output_progress)
         child_processes = get_all_child_processes(process.pid)
         child_pids = [child.pid for child in child_processes]
         
@@ -1210,24 +1897,19 @@ def run_continuous_process(command):
         process_info = {
             "cmd": command,
             "process": process,
-            "queue": output_queue,
+            "output": output_buffer,
             "cwd": cwd,
             "run_command": run_command,
             "pid": process.pid,
             "child_pids": child_pids
         }
-        running_processes.append(process_info)
+        register_process(process_info)
         
         # Print the process info
         print(f"Process Info: {process_info}")
         
-        # Collect initial output
-        initial_output = ""
-        while not output_queue.empty():
-            initial_output += output_queue.get_nowait()
-        
-        # Keep only the last 2000 characters of the initial output
-        initial_output = initial_output[-2000:]
+        # Collect initial output, keeping only the last 2000 characters
+        initial_output = drain_output_buffer(output_buffer, 2000)
         
         return f"Started new process: {command}\nInitial PID: {process.pid}\nChild PIDs: {child_pids}\nInitial output:\n{initial_output}"
     except PermissionError as e:
@@ -1243,47 +1925,41 @@ def run_continuous_process(command):
         return error_output
     except Exception as e:
         return f"Error executing command: {str(e)}"
-    finally:
-        # Change back to the original directory
-        os.chdir(cwd)
+
+def poll_process_output(process_info):
+    # New output (last 3000 characters) from a running process, or None once it
+    # has exited; leaves running_processes alone so callers can iterate it directly
+    if process_info["process"].poll() is not None:
+        return None
+    return drain_output_buffer(process_info["output"], 3000)
+
+def read_process_output(process_info):
+    output = poll_process_output(process_info)
+    if output is None:
+        unregister_process(process_info)
+        return "", ""  # Process has terminated
+    return process_info["cmd"], output  # Process is running
 
 def check_process_output(command):
-    process_key = get_process_key(command)
-    for process_info in running_processes[:]:  # Iterate over a copy of the list
-        if process_key in process_info["cmd"]:
-            process = process_info["process"]
-            output_queue = process_info["queue"]
-            if process.poll() is not None:
-                running_processes.remove(process_info)
-                return "", ""  # Process has terminated
-            output = ""
-            while not output_queue.empty():
-                try:
-                    output += output_queue.get_nowait()
-                except queue.Empty:
-                    break
-            # Keep only the last 2000 characters
-            output = output[-3000:]
-            return command, output  # Process is running
-    return "", ""  # No running process found
+    process_info = find_process(command)
+    if process_info is None:
+        return "", ""  # No running process found
+    status, output = read_process_output(process_info)
+    if status:
+        status = command
+    return status, output
 
 def restart_process(cmd):
-    global running_processes
-    process_key = get_process_key(cmd)
-    process_found = False
-    for process_info in running_processes:
-        if process_key in process_info['cmd']:
-            process_found = True
-            try:
-                os.killpg(os.getpgid(process_info['process'].pid), signal.SIGTERM)
-                process_info['process'].wait(timeout=5)
-            except Exception as e:
-                print(f"Error terminating process {cmd}: {str(e)}")
-            running_processes.remove(process_info)
-            print(f"Process '{cmd}' has been terminated.")
-            break
-    
-    if not process_found:
+    process_info = find_process(cmd)
+    if process_info is not None:
+        try:
+            os.killpg(os.getpgid(process_info['process'].pid), signal.SIGTERM)
+            process_info['process'].wait(timeout=5)
+        except Exception as e:
+            print(f"Error terminating process {cmd}: {str(e)}")
+        unregister_process(process_info)
+        print(f"Process '{cmd}' has been terminated.")
+    else:
         print(f"Process '{cmd}' was not running.")
     
     # Start the process in the background
@@ -1294,62 +1970,193 @@ def restart_process(cmd):
 
 command_decisions = {}
 
+LONG_RUNNING_SUGGESTION = (
+    "This command appears to start a long-running process (like an API server). "
+    "Consider using the INDEF action if it needs to run indefinitely. "
+    "If you believe this process should complete quickly, you can use the RUN action again."
+)
+
+# Actions written as "<VERB>: <argument>" that are dispatched on the verb alone
+COMMAND_VERB_HANDLERS = {
+    "INDEF": run_continuous_process,
+    "CHECK": check_process_output,
+}
+
 def execute_command(command, timeout=600):
     global command_decisions, frontend_testing_enabled, current_url
 
-    if frontend_testing_enabled:
-        if command.upper().startswith("UI_OPEN:"):
-            url = command.split(":", 1)[1].strip()
-            return ui_open_url(url), True
-        elif command.upper().startswith("UI_CLICK:"):
-            button_id = command.split(":", 1)[1].strip()
-            return ui_click_button(button_id), True
-        elif command.upper().startswith("UI_CHECK_TEXT:"):
-            parts = command.split(":", 2)
-            element_id = parts[1].strip()
-            expected_text = parts[2].strip()
-            return ui_check_element_text(element_id, expected_text), True
-        elif command.upper().startswith("UI_CHECK_LOG:"):
-            expected_log = command.split(":", 1)[1].strip()
-            return ui_check_console_logs(expected_log), True
-
-    if command.upper().startswith("INDEF:"):
-        cmd = command.split(":", 1)[1].strip()
-        output = run_continuous_process(cmd)
-        return output, True
-    elif command.upper().startswith("CHECK:"):
-        cmd = command.split(":", 1)[1].strip()
-        output = check_process_output(cmd)
-        return output, True
-    elif command.startswith("RAW:"):
-        raw_command = command[4:].strip()
-        if not require_approval(raw_command):
+    # Split off the verb once instead of upper-casing the command for every prefix check
+    verb, separator, argument = command.partition(":")
+    if separator:
+        verb_upper = verb.upper()
+        if frontend_testing_enabled and verb_upper in UI_COMMAND_VERB_HANDLERS:
+            return UI_COMMAND_VERB_HANDLERS[verb_upper](argument.strip()), True
+        if verb_upper in COMMAND_VERB_HANDLERS:
+            return COMMAND_VERB_HANDLERS[verb_upper](argument.strip()), True
+        if verb == "RAW":
+            raw_command = argument.strip()
+            if not require_approval(raw_command):
+                return "Command not approved by user.", False
+            
+            return execute_command_with_timeout(raw_command, timeout, interactive=True)
+        if verb_upper == "RUN":
+            command = argument.strip()
+
+    if "go run" in command and command not in command_decisions:
+        command_decisions[command] = "suggested_indef"
+        return LONG_RUNNING_SUGGESTION, True
+
+    if command in command_decisions and command_decisions[command] == "suggested_indef":
+        command_decisions[command] = "not_indefinite"
+    
+    if APPROVAL_COMMAND_PATTERN.match(command):
+        if not require_approval(command):
             return "Command not approved by user.", False
-        
-        return execute_command_with_timeout(raw_command, timeout)
-    else:
-        if command.upper().startswith("RUN:"):
-            command = command[4:].strip()
+        return execute_command_with_timeout(command, timeout, interactive=True)
+    
+    return execute_command_with_timeout(command, timeout)
 
-        if "go run" in command and command not in command_decisions:
-            suggestion = (
-                "This command appears to start a long-running process (like an API server). "
-                "Consider using the INDEF action if it needs to run indefinitely. "
-                "If you believe this process should complete quickly, you can use the RUN action again."
-            )
-            command_decisions[command] = "suggested_indef"
-            return suggestion, True
+class ShellSession:
+    """
+    A long-lived bash process that runs commands one at a time, so each
+    command doesn't pay for starting a new shell.
+
+    Every command runs in a subshell with stdin closed, so `cd`, exported
+    variables and other state don't leak into the next command. Commands that
+    read from the terminal (password or confirmation prompts) therefore fail
+    here; those go through run_interactive_command instead. The exit code
+    is reported through a sentinel line on stdout, and a second sentinel on
+    stderr marks the end of the error output.
+
+    Output beyond OUTPUT_HEAD_BYTES + OUTPUT_TAIL_BYTES is dropped from the
+    middle while the command runs, so a very chatty command doesn't have to be
+    held in memory in full.
+    """
+    SENTINEL = "__DEVLM_EOF__"
+    OUTPUT_HEAD_BYTES = 64 * 1024
+    OUTPUT_TAIL_BYTES = 256 * 1024
+
+    def __init__(self, cwd, env):
+        self.cwd = cwd
+        self.env = env
+        self.process = subprocess.Popen(['/bin/bash', '--noprofile', '--norc'], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
+        self.stdout_pattern = re.compile(rb'\n' + self.SENTINEL.encode() + rb'(\d+)\n$')
+        self.stderr_marker = b'\n' + self.SENTINEL.encode() + b'\n'
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def run(self, command, timeout):
+        """
+        Run a command in the session.
 
-        if command in command_decisions and command_decisions[command] == "suggested_indef":
-            command_decisions[command] = "not_indefinite"
-        
-        if any(command.startswith(cmd) for cmd in APPROVAL_REQUIRED_COMMANDS):
-            if not require_approval(command):
-                return "Command not approved by user.", False
-        
-        return execute_command_with_timeout(command, timeout)
+        Returns (stdout, stderr, return_code). return_code is None if the
+        command timed out, in which case the session is closed.
+        """
+        script = (
+            f"( eval {shlex.quote(command)} ) < /dev/null\n"
+            f"printf '\\n{self.SENTINEL}%d\\n' $?\n"
+            f"printf '\\n{self.SENTINEL}\\n' >&2\n"
+        )
+        self.process.stdin.write(script.encode())
+        self.process.stdin.flush()
+
+        buffers = {self.process.stdout.fileno(): bytearray(), self.process.stderr.fileno(): bytearray()}
+        stdout_buffer = buffers[self.process.stdout.fileno()]
+        stderr_buffer = buffers[self.process.stderr.fileno()]
+        dropped = {fd: 0 for fd in buffers}
+        # The exit-code sentinel can only be in the last few bytes of stdout
+        sentinel_window = len(self.SENTINEL) + 32
+        deadline = time.monotonic() + timeout
+        stdout_match = None
+
+        with selectors.DefaultSelector() as selector:
+            for fd in buffers:
+                selector.register(fd, selectors.EVENT_READ)
+            while stdout_match is None or not stderr_buffer.endswith(self.stderr_marker):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close()
+                    return None, None, None
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        # The shell itself died; report what we have
+                        self.close()
+                        return (self._decode(stdout_buffer, dropped[self.process.stdout.fileno()]),
+                                self._decode(stderr_buffer, dropped[self.process.stderr.fileno()]), -1)
+                    buffer = buffers[key.fd]
+                    buffer += data
+                    excess = len(buffer) - self.OUTPUT_HEAD_BYTES - self.OUTPUT_TAIL_BYTES
+                    if excess > 0:
+                        del buffer[self.OUTPUT_HEAD_BYTES:self.OUTPUT_HEAD_BYTES + excess]
+                        dropped[key.fd] += excess
+                if stdout_match is None:
+                    window_start = max(0, len(stdout_buffer) - sentinel_window)
+                    stdout_match = self.stdout_pattern.search(stdout_buffer, window_start)
+
+        stdout = self._decode(stdout_buffer[:stdout_match.start()], dropped[self.process.stdout.fileno()])
+        stderr = self._decode(stderr_buffer[:-len(self.stderr_marker)], dropped[self.process.stderr.fileno()])
+        return stdout, stderr, int(stdout_match.group(1))
+
+    @classmethod
+    def _decode(cls, data, dropped=0):
+        if dropped:
+            data = (data[:cls.OUTPUT_HEAD_BYTES] + f"\n...[{dropped} bytes omitted]...\n".encode()
+                    + data[cls.OUTPUT_HEAD_BYTES:])
+        return bytes(data).decode('utf-8', errors='replace').replace('\r\n', '\n')
+
+    def close(self):
+        if not self.is_alive():
+            return
+        # Kill anything the timed-out command left running before the shell itself
+        try:
+            for child in psutil.Process(self.process.pid).children(recursive=True):
+                child.kill()
+        except psutil.NoSuchProcess:
+            pass
+        self.process.kill()
+        self.process.wait()
+
+shell_session = None
+shell_session_lock = threading.Lock()
+
+def run_in_shell_session(command, timeout):
+    global shell_session
+    with shell_session_lock:
+        # Start a new session if the previous one died or the project directory or
+        # environment changed, so commands see the same state a fresh shell would
+        env = dict(os.environ)
+        if (shell_session is None or not shell_session.is_alive() or shell_session.cwd != os.getcwd()
+                or shell_session.env != env):
+            if shell_session is not None:
+                shell_session.close()
+            shell_session = ShellSession(os.getcwd(), env)
+        return shell_session.run(command, timeout)
+
+def run_interactive_command(command, timeout):
+    # For commands the user approved: run in a fresh shell that keeps the terminal
+    # as stdin, so password and confirmation prompts can be answered. Returns
+    # (stdout, stderr, return_code) like ShellSession.run.
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True,
+                               universal_newlines=True, executable='/bin/bash')
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        return None, None, None
+    return stdout, stderr, process.returncode
+
+def close_shell_session():
+    with shell_session_lock:
+        if shell_session is not None:
+            shell_session.close()
+
+atexit.register(close_shell_session)
 
-def execute_command_with_timeout(command, timeout):
+def execute_command_with_timeout(command, timeout, interactive=False):
     ## Split the command into parts
     #command_parts = command.split('&&')
     #
@@ -1392,38 +2199,23 @@ def execute_command_with_timeout(command, timeout):
     #                output += f"Error: Command '{part.split()[0]}' not found\n"
     #                return_code = 1
     #                break
-    current_dir = os.getcwd()
     output = ""
-    return_code = 0
-
-    try:
-        # Execute the entire command as a single shell command
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, universal_newlines=True, executable='/bin/bash')
-        
-        def timeout_handler(signum, frame):
-            process.kill()
-            raise subprocess.TimeoutExpired(command, timeout)
-
-        # Set up the timeout
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
 
-        try:
-            stdout, stderr = process.communicate()
-            return_code = process.returncode
-            output += f"Command: {command}\n"
-            output += f"STDOUT:\n{stdout}\n"
-            output += f"STDERR:\n{stderr}\n"
-            if return_code != 0:
-                output += f"Command failed with return code {return_code}\n"
-        except subprocess.TimeoutExpired:
-            output += f"Command execution timed out after {timeout} seconds.\n"
-            return_code = -1
-        finally:
-            signal.alarm(0)  # Cancel the alarm
-    finally:
-        # Always change back to the original directory
-        os.chdir(current_dir)
+    # Execute the entire command in the shared shell session, or with the terminal
+    # attached if the user approved it and may need to answer a prompt
+    if interactive:
+        stdout, stderr, return_code = run_interactive_command(command, timeout)
+    else:
+        stdout, stderr, return_code = run_in_shell_session(command, timeout)
+    if return_code is None:
+        output += f"Command execution timed out after {timeout} seconds.\n"
+        return_code = -1
+    else:
+        output += f"Command: {command}\n"
+        output += f"STDOUT:\n{stdout}\n"
+        output += f"STDERR:\n{stderr}\n"
+        if return_code != 0:
+            output += f"Command failed with return code {return_code}\n"
 
     if return_code != 0:
         return output, False
@@ -1465,20 +2257,83 @@ def check_environment(command):
         return success, output
 
 def modify_file(file_path, content):
-    with open(file_path, 'w') as f:
-        f.write(content)
+    # Encode once and write the raw bytes, bypassing the buffered text layer
+    data = memoryview(content.encode('utf-8'))
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+    finally:
+        os.close(fd)
 
 def read_file(file_path):
-    with open(file_path, 'r') as f:
-        return f.read()
+    with open(file_path, 'rb') as f:
+        content = f.read().decode('utf-8')
+    # Translate newlines the way a text-mode read would
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+READ_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Total size of the file contents kept by read_file_cached
+
+# Last read contents of each file with the (mtime_ns, size) they were read at,
+# in least recently used order. Only one version per path is kept, and the
+# total size is bounded rather than the number of files.
+read_cache = {}
+read_cache_size = 0
+read_cache_lock = threading.Lock()
+
+def read_file_cached(file_path):
+    # Repeated inspections of unchanged files skip the read
+    global read_cache_size
+    st = os.stat(file_path)
+    with read_cache_lock:
+        cached = read_cache.pop(file_path, None)
+        if cached is not None:
+            if cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                read_cache[file_path] = cached  # Mark as most recently used
+                return cached[2]
+            read_cache_size -= cached[1]
+    content = read_file(file_path)
+    with read_cache_lock:
+        previous = read_cache.pop(file_path, None)
+        if previous is not None:
+            read_cache_size -= previous[1]
+        read_cache[file_path] = (st.st_mtime_ns, st.st_size, content)
+        read_cache_size += st.st_size
+        while read_cache_size > READ_CACHE_MAX_BYTES and len(read_cache) > 1:
+            read_cache_size -= read_cache.pop(next(iter(read_cache)))[1]
+    return content
+
+def read_file_if_exists(file_path):
+    # The stat in read_file_cached doubles as the existence check
+    try:
+        return read_file_cached(file_path)
+    except FileNotFoundError:
+        return None
+
+def read_files(file_paths):
+    # Read several files concurrently; missing files map to None
+    paths = list(dict.fromkeys(file_paths))
+    if len(paths) <= 1:
+        return {path: read_file_if_exists(path) for path in paths}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(FILE_READ_MAX_WORKERS, len(paths))) as executor:
+        return dict(zip(paths, executor.map(read_file_if_exists, paths)))
 
 def load_technical_brief():
-    if os.path.exists(TECHNICAL_BRIEF_FILE):
-        with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    try:
+        return read_json_file(TECHNICAL_BRIEF_FILE)
+    except FileNotFoundError:
+        return {}
+
+def get_file_technical_brief(technical_brief, file_path, file_index=None):
+    # file_index (from build_file_index) answers exact paths without walking the tree
+    if file_index is not None:
+        file_entry = file_index.get(os.path.normpath(file_path))
+        if file_entry is not None:
+            return file_entry
 
-def get_file_technical_brief(technical_brief, file_path):
     def search_directories(directories, path_parts):
         if not path_parts:
             return None
@@ -1511,15 +2366,80 @@ def get_file_technical_brief(technical_brief, file_path):
     
     return result
 
+# Number of command_history entries already appended to COMMAND_HISTORY_FILE
+command_history_saved_count = 0
+# Append handle kept open across saves instead of reopening the file every iteration
+command_history_file = None
+
 def save_command_history(command_history):
-    with open(COMMAND_HISTORY_FILE, 'w') as f:
-        json.dump(command_history, f, indent=2)
+    # The history file is JSONL, so only entries added since the last save are appended
+    global command_history_saved_count, command_history_file
+    new_entries = command_history[command_history_saved_count:]
+    if not new_entries:
+        return
+    if command_history_file is None or command_history_file.closed or command_history_file.name != COMMAND_HISTORY_FILE:
+        if command_history_file is not None:
+            command_history_file.close()
+        command_history_file = open(COMMAND_HISTORY_FILE, 'ab')
+    command_history_file.write(b''.join(to_json_line(entry) for entry in new_entries))
+    command_history_file.flush()
+    command_history_saved_count = len(command_history)
 
 def load_command_history():
-    if os.path.exists(COMMAND_HISTORY_FILE):
-        with open(COMMAND_HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    global command_history_saved_count
+    try:
+        with open(COMMAND_HISTORY_FILE, 'rb') as f:
+            command_history = [parse_json(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        command_history = []
+    command_history_saved_count = len(command_history)
+    return command_history
+
+# File extensions where the LLM might respond with a code block
+CODE_BLOCK_EXTENSIONS = frozenset([
+    '.py', '.go', '.js', '.java', '.c', '.cpp', '.h', '.hpp', '.sh',
+    '.html', '.css', '.sql', '.Dockerfile', '.makefile'
+])
+
+# File extensions for plain text files
+PLAIN_TEXT_EXTENSIONS = frozenset([
+    '.md', '.txt', '.yml', '.yaml', '.ini', '.cfg', '.conf',
+    '.gitignore', '.env', '.properties', '.log'
+])
+
+CODE_FENCE_TAG_PATTERN = re.compile(r'\w*')
+
+def find_code_block(text):
+    """
+    Return the body of the first fenced code block in text, or None.
+
+    Matches the same blocks as r'```(?:\\w+)?\\n([\\s\\S]*?)\\n```', but finds the
+    fences with str.find rather than testing for the closing fence at every
+    character of a long response.
+    """
+    start = text.find('```')
+    while start != -1:
+        line_end = text.find('\n', start + 3)
+        if line_end == -1:
+            return None
+        if CODE_FENCE_TAG_PATTERN.fullmatch(text, start + 3, line_end):
+            end = text.find('\n```', line_end + 1)
+            if end == -1:
+                return None
+            return text[line_end + 1:end]
+        start = text.find('```', start + 1)
+    return None
+
+def extract_complete_content(response_text, file_path):
+    # extract_content for responses about to be cached: an empty result, or a code
+    # block that was opened but never closed (cut off at max_tokens), raises ValueError
+    content = extract_content(response_text, file_path)
+    if not content:
+        raise ValueError(f"Empty content response for {file_path}")
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension in CODE_BLOCK_EXTENSIONS and response_text.lstrip().startswith("```") and find_code_block(response_text) is None:
+        raise ValueError(f"Truncated content response for {file_path}")
+    return content
 
 def extract_content(response_text, file_path):
     # Print the response text (for debugging)  
@@ -1527,36 +2447,24 @@ def extract_content(response_text, file_path):
 
     file_extension = os.path.splitext(file_path)[1].lower()
 
-    # File extensions where the LLM might respond with a code block
-    code_block_extensions = [
-        '.py', '.go', '.js', '.java', '.c', '.cpp', '.h', '.hpp', '.sh',
-        '.html', '.css', '.sql', '.Dockerfile', '.makefile'
-    ]
-
-    # File extensions for plain text files
-    plain_text_extensions = [
-        '.md', '.txt', '.yml', '.yaml', '.ini', '.cfg', '.conf',
-        '.gitignore', '.env', '.properties', '.log'
-    ]
-
-    if file_extension in code_block_extensions:
+    if file_extension in CODE_BLOCK_EXTENSIONS:
         # Check if the response contains a code block
-        code_match = re.search(r'```(?:\w+)?\n([\s\S]*?)\n```', response_text)
-        if code_match:
-            return code_match.group(1).strip()
+        code_block = find_code_block(response_text)
+        if code_block is not None:
+            return code_block.strip()
         else:
             # If no code block is found, return the entire response
             return response_text.strip()
     
-    elif file_extension in plain_text_extensions or not file_extension:
+    elif file_extension in PLAIN_TEXT_EXTENSIONS or not file_extension:
         # For plain text files or files without extension, return the entire response
         return response_text.strip()
 
     elif file_extension == '.json':
         # For JSON files, attempt to parse and format the content
         try:
-            parsed = json.loads(response_text)
-            return json.dumps(parsed, indent=2)
+            parsed = parse_json(response_text)
+            return pretty_json(parsed)
         except json.JSONDecodeError:
             # If parsing fails, return the response as is
             return response_text.strip()
@@ -1567,7 +2475,8 @@ def extract_content(response_text, file_path):
         return response_text.strip()
 
 def get_last_n_iterations(command_history, count):
-    return command_history[-count:] if len(command_history) > count else command_history
+    # A negative slice already copies at most count entries, however long the history is
+    return command_history[-count:]
 
 llm_notes = {
     "general": "",
@@ -1582,7 +2491,7 @@ MAX_NOTES_LENGTH = 2000
 def update_notes(new_notes):
     global llm_notes
     try:
-        updated_notes = json.loads(new_notes)
+        updated_notes = parse_json(new_notes)
         for key in llm_notes.keys():
             if key in updated_notes:
                 if isinstance(llm_notes[key], list):
@@ -1606,6 +2515,24 @@ def add_line_numbers(content):
     numbered_lines = [f"{i+1}:{line}" for i, line in enumerate(lines)]
     return '\n'.join(numbered_lines)
 
+MAX_OUTPUT_ENTRY_LENGTH = 12000  # Characters of command output kept in a history entry
+
+def truncate_output(output, max_length=MAX_OUTPUT_ENTRY_LENGTH):
+    return output if len(output) <= max_length else output[:max_length] + "...[truncated]"
+
+def clip_content(content, head_length=INSPECT_HEAD_LENGTH, tail_length=INSPECT_TAIL_LENGTH):
+    # Keep the start and end of large files so the prompt size stays bounded
+    if len(content) <= head_length + tail_length:
+        return content
+    clipped = len(content) - head_length - tail_length
+    return f"{content[:head_length]}\n...[clipped {clipped} characters]...\n{content[-tail_length:]}"
+
+ANALYSIS_OUTPUT_HEAD_LENGTH = 500  # Characters from the start of command output sent for analysis
+ANALYSIS_OUTPUT_TAIL_LENGTH = 2000  # Errors and tracebacks usually sit at the end
+
+def summarize_output(output):
+    return clip_content(output, ANALYSIS_OUTPUT_HEAD_LENGTH, ANALYSIS_OUTPUT_TAIL_LENGTH)
+
 def truncate_content(numbered_content, max_length):
     """
     Truncates the numbered content at the first newline after max_length characters
@@ -1665,25 +2592,28 @@ def create_git_patch(file_path, changes):
     hunk_old_lines = 0
     hunk_new_lines = 0
 
-    changes_list = sorted([c for c in changes.split('\n') if c.strip()], key=lambda x: int(x.split(':')[0].lstrip('+-')))
+    # Parse every change once into (line_num, kind, content) and sort on the line number
+    changes_list = []
+    for change in changes.split('\n'):
+        if not change.strip():
+            continue
+        kind = change[0] if change[0] in '+-' else ''
+        line_num, _, content = change[len(kind):].partition(':')
+        changes_list.append((int(line_num), kind, content))
+    changes_list.sort(key=lambda change: change[0])
 
-    for change in changes_list:
-        if change.startswith('+'):
-            line_num, content = change[1:].split(':', 1)
-            line_num = int(line_num)
+    for line_num, kind, content in changes_list:
+        if kind == '+':
             if hunk_start is None:
                 hunk_start = max(1, line_num)
             hunk_lines.append(f"+{content}")
             hunk_new_lines += 1
-        elif change.startswith('-'):
-            line_num = int(change[1:])
+        elif kind == '-':
             if hunk_start is None:
                 hunk_start = max(1, line_num)
             hunk_lines.append("-")
             hunk_old_lines += 1
         else:
-            line_num, content = change.split(':', 1)
-            line_num = int(line_num)
             if hunk_start is None:
                 hunk_start = max(1, line_num)
             hunk_lines.append(f"-{content}")
@@ -1719,23 +2649,16 @@ def apply_git_patch(file_path, patch_content):
                 f.write('')
             subprocess.run(['git', 'add', file_path], check=True)
 
-        # Apply the patch
-        result = subprocess.run(['git', 'apply', '--verbose', '--ignore-whitespace', '--unidiff-zero', '--reject', temp_file_path], 
+        # Apply the patch in a single git invocation. --recount recomputes the hunk
+        # line counts, so slightly off headers from the LLM still apply.
+        result = subprocess.run(['git', 'apply', '--verbose', '--ignore-whitespace', '--unidiff-zero', '--recount', '--reject', temp_file_path], 
                                 capture_output=True, text=True)
         if result.returncode == 0:
             print(f"Successfully applied patch to {file_path}")
             return True
         else:
             print(f"Failed to apply patch: {result.stderr}")
-            # Try to apply the patch with increased context
-            result = subprocess.run(['git', 'apply', '--verbose', '--ignore-whitespace', '--unidiff-zero', '--reject', '-C3', temp_file_path],
-                                    capture_output=True, text=True)
-            if result.returncode == 0:
-                print(f"Successfully applied patch to {file_path} with increased context")
-                return True
-            else:
-                print(f"Failed to apply patch even with increased context: {result.stderr}")
-                return False
+            return False
     except subprocess.CalledProcessError as e:
         print(f"Error during patch application: {e}")
         return False
@@ -1765,61 +2688,94 @@ def parse_changes(changes_text):
 
 def apply_changes(current_content, changes):
     lines = current_content.split('\n') if current_content else []
-    new_lines = []
     changes_dict = {}
+    modified_lines = set()
+    deletions = set()
     
-    # Separate additions/modifications from deletions
-    additions_modifications = []
-    deletions = []
-    
+    # Group additions/modifications by line number and separate deletions
     for change in changes:
         line_num = int(change.split(':', 1)[0].lstrip('+-'))
         if change.startswith('-'):
-            deletions.append(line_num)
+            deletions.add(line_num)
         else:
-            additions_modifications.append((line_num, change))
+            if not change.startswith('+'):
+                modified_lines.add(line_num)
+            changes_dict.setdefault(line_num, []).append(change.split(':', 1)[1])
     
-    # Sort additions and modifications
-    additions_modifications.sort(key=lambda x: x[0])
-    
-    current_line = 1
-    for line_num, change in additions_modifications:
-        # Add any unchanged lines
-        while current_line < line_num:
-            if current_line not in deletions and current_line <= len(lines):
-                new_lines.append(lines[current_line - 1])
-            current_line += 1
-        
-        # Apply the change
-        if change.startswith('+'):
-            new_lines.append(change.split(':', 1)[1])
-            if line_num not in deletions:
-                current_line -= 1  # Don't increment current_line for additions
-        else:
-            new_lines.append(change.split(':', 1)[1])
-        current_line += 1
+    new_lines = []
+    for line_num, line in enumerate(lines, 1):
+        if line_num in changes_dict:
+            new_lines.extend(changes_dict[line_num])
+        # Additions go before the original line, modifications replace it
+        if line_num not in modified_lines and line_num not in deletions:
+            new_lines.append(line)
     
-    # Add any remaining unchanged lines
-    while current_line <= len(lines):
-        if current_line not in deletions:
-            new_lines.append(lines[current_line - 1])
-        current_line += 1
+    # Append any changes that fall beyond the end of the file
+    for line_num in sorted(changes_dict):
+        if line_num > len(lines):
+            new_lines.extend(changes_dict[line_num])
     
     return '\n'.join(new_lines)
 
+# (digest, st_mtime_ns, st_size) of the content compare_and_write last saw for each
+# path, so a repeated identical write is detected without reading the file back
+written_file_digests = {}
+
+REWRITE_COMPARE_CHUNK_BYTES = 64 * 1024  # Bytes compared per step when looking for the first change
+
+def common_prefix_length(old_data, new_data):
+    # Skip equal chunks with one comparison each, then bisect the chunk that differs
+    limit = min(len(old_data), len(new_data))
+    start = 0
+    while start < limit and old_data[start:start + REWRITE_COMPARE_CHUNK_BYTES] == new_data[start:start + REWRITE_COMPARE_CHUNK_BYTES]:
+        start += REWRITE_COMPARE_CHUNK_BYTES
+    low, high = min(start, limit), min(start + REWRITE_COMPARE_CHUNK_BYTES, limit)
+    while low < high:
+        middle = (low + high) // 2
+        if old_data[low:middle + 1] == new_data[low:middle + 1]:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def write_changed_tail(file_path, old_data, new_data):
+    # Rewrite the file in place from its first changed byte, so an edit near
+    # the end of a large file doesn't write the unchanged start again
+    offset = common_prefix_length(old_data, new_data)
+    data = memoryview(new_data)[offset:]
+    fd = os.open(file_path, os.O_WRONLY)
+    try:
+        while data:
+            written = os.pwrite(fd, data, offset)
+            offset += written
+            data = data[written:]
+        os.ftruncate(fd, len(new_data))
+    finally:
+        os.close(fd)
+
 def compare_and_write(file_path, new_content):
     try:
-        with open(file_path, 'r') as f:
-            old_content = f.read()
+        new_data = new_content.encode('utf-8')
+        new_digest = hashlib.blake2b(new_data, digest_size=16).digest()
+        st = os.stat(file_path)
+        if written_file_digests.get(file_path) == (new_digest, st.st_mtime_ns, st.st_size):
+            print(f"File {file_path} content is identical. No changes made.")
+            return False, None
+
+        with open(file_path, 'rb') as f:
+            old_data = f.read()
         
-        if old_content != new_content:
+        # Compare the raw bytes first so unchanged files skip decoding and diffing
+        if old_data != new_data:
+            old_content = old_data.decode('utf-8')
             diff = list(difflib.unified_diff(old_content.splitlines(keepends=True), 
                                              new_content.splitlines(keepends=True), 
                                              fromfile='before', 
                                              tofile='after'))
             if diff:
-                with open(file_path, 'w') as f:
-                    f.write(new_content)
+                write_changed_tail(file_path, old_data, new_data)
+                st = os.stat(file_path)
+                written_file_digests[file_path] = (new_digest, st.st_mtime_ns, st.st_size)
                 print(f"Changes made to {file_path}:")
                 diff = ''.join(diff)
                 print(diff)
@@ -1828,15 +2784,47 @@ def compare_and_write(file_path, new_content):
                 print(f"No actual changes to write in {file_path}")
                 return False, None
         else:
+            written_file_digests[file_path] = (new_digest, st.st_mtime_ns, st.st_size)
             print(f"File {file_path} content is identical. No changes made.")
             return False, None
     except FileNotFoundError:
         return False, None
 
-def update_project_structure(file_path):
-    with open('project_structure.json', 'r') as f:
-        project_structure = json.load(f)
+# In-memory copy of project_structure.json shared across update_project_structure
+# calls. It is written back every PROJECT_STRUCTURE_FLUSH_INTERVAL updates and at exit;
+# project_structure_pending_updates holds the file paths added since the last write.
+project_structure_cache = None
+project_structure_cache_mtime = None
+project_structure_pending_updates = []
+PROJECT_STRUCTURE_FLUSH_INTERVAL = 10
+
+def load_project_structure_cache():
+    global project_structure_cache, project_structure_cache_mtime
+    mtime = os.stat('project_structure.json').st_mtime_ns
+    # Reload if the file was rewritten by someone else since we last read it
+    if project_structure_cache is None or mtime != project_structure_cache_mtime:
+        project_structure_cache = read_json_file('project_structure.json')
+        project_structure_cache_mtime = mtime
+        # Merge the updates that hadn't been written yet into the reloaded copy
+        # and save it, rather than dropping them
+        if project_structure_pending_updates:
+            for file_path in project_structure_pending_updates:
+                add_to_project_structure(project_structure_cache, file_path)
+            flush_project_structure()
+    return project_structure_cache
+
+def flush_project_structure():
+    global project_structure_cache_mtime, project_structure_pending_updates
+    if project_structure_cache is None or not project_structure_pending_updates:
+        return
+    write_json_file('project_structure.json', project_structure_cache)
+    project_structure_cache_mtime = os.stat('project_structure.json').st_mtime_ns
+    project_structure_pending_updates = []
 
+atexit.register(flush_project_structure)
+
+def add_to_project_structure(project_structure, file_path):
+    # Returns True if file_path was not in project_structure yet
     # Split the file path into components
     path_parts = file_path.split(os.sep)
     
@@ -1856,17 +2844,27 @@ def update_project_structure(file_path):
     
     # Add the file to the appropriate level
     file_name = path_parts[-1]
-    if file_name not in current_level[""]:
-        current_level[""].append(file_name)
+    if file_name in current_level[""]:
+        return False
+    current_level[""].append(file_name)
+    return True
+
+def update_project_structure(file_path):
+    project_structure = load_project_structure_cache()
+
+    if add_to_project_structure(project_structure, file_path):
         print(f"Updated project structure with new file: {file_path}")
+        project_structure_pending_updates.append(file_path)
     else:
         print(f"File {file_path} already exists in the project structure.")
     
-    # Save the updated structure
-    with open('project_structure.json', 'w') as f:
-        json.dump(project_structure, f, indent=2)
+    # Save the updated structure once enough updates have accumulated
+    if len(project_structure_pending_updates) >= PROJECT_STRUCTURE_FLUSH_INTERVAL:
+        flush_project_structure()
     
+# Files that produced no changes, mapped to the tick at which they may be written again
 unchanged_files = {}
+unchanged_files_tick = 0
 last_chat_content = ""
 chat_updated = False
 chat_updated_iteration = 0
@@ -1879,13 +2877,70 @@ def ensure_chat_file_exists():
         print(f"Created {CHAT_FILE}. You can write notes in this file to communicate with the LLM.")
 
 def read_chat_file():
-    if os.path.exists(CHAT_FILE):
+    try:
         with open(CHAT_FILE, 'r') as f:
             return f.read().strip()
-    return ""
+    except FileNotFoundError:
+        return ""
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None  # Fall back to polling the chat file's mtime
+
+chat_file_changed = threading.Event()
+chat_observer = None
+last_chat_mtime = None
+
+def get_chat_mtime():
+    try:
+        return os.stat(CHAT_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def start_chat_watcher():
+    # Get notified of chat file writes instead of re-reading it every iteration
+    global chat_observer, last_chat_mtime
+    last_chat_mtime = get_chat_mtime()
+    if Observer is None or chat_observer is not None:
+        return
+    chat_path = os.path.abspath(CHAT_FILE)
+
+    class ChatFileHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            paths = (getattr(event, 'src_path', None), getattr(event, 'dest_path', None))
+            if any(path and os.path.abspath(path) == chat_path for path in paths):
+                chat_file_changed.set()
+
+    try:
+        observer = Observer()
+        observer.schedule(ChatFileHandler(), os.path.dirname(chat_path), recursive=False)
+        observer.daemon = True
+        observer.start()
+        chat_observer = observer
+        atexit.register(stop_chat_watcher)
+    except Exception as e:
+        print(f"Could not start chat file watcher, falling back to polling: {e}")
+
+def stop_chat_watcher():
+    global chat_observer
+    if chat_observer is not None:
+        chat_observer.stop()
+        chat_observer.join(timeout=1)
+        chat_observer = None
 
 def check_chat_updates():
-    global last_chat_content, chat_updated
+    global last_chat_content, chat_updated, last_chat_mtime
+    if chat_observer is not None:
+        if not chat_file_changed.is_set():
+            return False
+        chat_file_changed.clear()
+    else:
+        mtime = get_chat_mtime()
+        if mtime == last_chat_mtime:
+            return False
+        last_chat_mtime = mtime
     current_content = read_chat_file()
     if current_content != last_chat_content:
         chat_updated = True
@@ -1905,25 +2960,22 @@ def load_history_brief() -> Dict:
     try:
         # make sure the file exist else create it
         if not os.path.exists(HISTORY_BRIEF_FILE):
-            with open(HISTORY_BRIEF_FILE, 'w') as f:
-                json.dump({}, f, indent=2)
-        with open(HISTORY_BRIEF_FILE, 'r') as f:
-            return json.load(f)
+            write_json_file(HISTORY_BRIEF_FILE, {})
+        return read_json_file(HISTORY_BRIEF_FILE)
     except FileNotFoundError:
         return { "key_events": []}
 
 def save_history_brief(brief: Dict):
-    with open(HISTORY_BRIEF_FILE, 'w') as f:
-        json.dump(brief, f, indent=2)
+    write_json_file(HISTORY_BRIEF_FILE, brief)
 
 def update_history_brief(command_history: List[Dict], current_brief: Dict, user_goal: str, chat_content: str, project_structure: Dict) -> Dict:
-    recent_commands = command_history[-30:]  # Get the last MAX_BRIEF_COMMANDS commands
+    recent_commands = command_history[-30:]  # A negative slice copies only these entries, however long the history
     
     update_prompt = f"""
     You are an assistant tasked with maintaining a concise history brief of a software development project. Since you are only provided the last 15 raw commands, you need to extract key events and summarize the project's progress based on the command history, user messages and the previous brief. This will help in tracking the project's development and identifying any issues or challenges and prevent repetition of the same mistakes and work. Be specific and concise in your output so that the project's progress can be easily tracked.
 
     Recent command history (last 30 commands):
-    {json.dumps(recent_commands, indent=2)}
+    {compact_json(recent_commands)}
 
     Please update the history brief with the following guidelines:
     1. In context of the user chat content, extract key events and summarize the project's progress.
@@ -1945,7 +2997,7 @@ def update_history_brief(command_history: List[Dict], current_brief: Dict, user_
     response = llm_client.generate_response(update_prompt, 4000)
     print(f"History brief response: {response}")
     try:
-        updated_brief = json.loads(response)
+        updated_brief = parse_json(response)
         return updated_brief
     except json.JSONDecodeError:
         print("Error: Failed to parse LLM response as JSON. Using previous brief.")
@@ -1959,7 +3011,7 @@ def get_history_brief_for_prompt(brief: Dict) -> str:
     {chr(10).join(f"- {event}" for event in brief['key_events'])}
     """
 
-last_inspected_files = []
+last_inspected_files = frozenset()
 
 HasUserInterrupted = False
 
@@ -1972,24 +3024,20 @@ frontend_testing_enabled = False
 browser = None
 current_url = None
 
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import WebDriverException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# Shared session so repeated health checks reuse the same connection pool
+http_session = requests.Session()
 
 def check_url_accessibility(url, timeout=5):
     try:
-        response = requests.get(url, timeout=timeout)
+        response = http_session.get(url, timeout=timeout)
         return response.status_code == 200
     except requests.RequestException:
         return False
 
 def diagnose_chrome_connection():
     try:
-        response = requests.get("http://localhost:9222/json/version", timeout=5)
+        response = http_session.get("http://localhost:9222/json/version", timeout=5)
         if response.status_code == 200:
             print("Chrome DevTools is accessible.")
             return True
@@ -2028,7 +3076,6 @@ def ensure_chrome_is_running():
     if not diagnose_chrome_connection():
         print("Chrome DevTools is not accessible. Please check Chrome's status manually.")
 
-from selenium.webdriver.chrome.options import Options
 
 def setup_frontend_testing():
     global browser
@@ -2062,7 +3109,6 @@ def teardown_frontend_testing():
         browser.quit()
         print("Chrome browser closed")
 
-import random
 
 def connect_to_chrome(max_retries=5, retry_delay=5):
     global browser
@@ -2202,7 +3248,6 @@ def ui_check_console_logs(expected_log):
     except Exception as e:
         return f"Error checking console logs: {str(e)}\n\nUnable to retrieve logs.", False
 
-import threading
 
 # Global variables for XHR capture
 xhr_capture_thread = None
@@ -2262,8 +3307,20 @@ def ui_xhr_capture_stop():
     xhr_capture_thread.join()
     xhr_capture_thread = None
     
-    capture_result = json.dumps(captured_xhr_requests, indent=2)
+    capture_result = pretty_json(captured_xhr_requests)
     return f"XHR capture stopped. Captured requests:\n{capture_result}", True
+
+def ui_check_text_command(argument):
+    element_id, expected_text = argument.split(":", 1)
+    return ui_check_element_text(element_id.strip(), expected_text.strip())
+
+# Verb dispatch for execute_command when frontend testing is enabled
+UI_COMMAND_VERB_HANDLERS = {
+    "UI_OPEN": ui_open_url,
+    "UI_CLICK": ui_click_button,
+    "UI_CHECK_TEXT": ui_check_text_command,
+    "UI_CHECK_LOG": ui_check_console_logs,
+}
     
 def ensure_chrome_is_running():
     try:
@@ -2318,6 +3375,70 @@ def handle_ui_action(command):
     
 HasUserInterrupted = False
 user_suggestion = ""
+# Set by the signal handlers; acted on by the main loop at a safe point
+interrupt_requested = threading.Event()
+shutdown_requested = threading.Event()
+
+# Worker thread of the last interruptible request; an abandoned one may still be running
+llm_request_thread = None
+
+def generate_response_interruptible(llm_client, prompt, max_tokens, cached_prefix=None):
+    # Wait for the response on a worker thread so Ctrl+C can abandon the
+    # request instead of being latched until it returns. Returns None if interrupted.
+    global llm_request_thread
+    # An abandoned request can't be cancelled, and the client's retry state isn't
+    # shared safely, so the next request waits for it to finish
+    if llm_request_thread is not None and llm_request_thread.is_alive():
+        print("Waiting for the interrupted LLM request to finish...")
+        while llm_request_thread.is_alive():
+            llm_request_thread.join(0.1)
+            if interrupt_requested.is_set() or shutdown_requested.is_set():
+                return None
+    result = {}
+    done = threading.Event()
+
+    def worker():
+        try:
+            result["response"] = llm_client.generate_response(prompt, max_tokens, cached_prefix)
+        except Exception as e:
+            result["error"] = e
+        finally:
+            done.set()
+
+    llm_request_thread = threading.Thread(target=worker, daemon=True)
+    llm_request_thread.start()
+    while not done.wait(0.1):
+        if interrupt_requested.is_set() or shutdown_requested.is_set():
+            return None
+    if "error" in result:
+        raise result["error"]
+    return result["response"]
+
+ANALYSIS_CACHE_SIZE = 64
+# Responses to analysis prompts keyed on (sha256 of the prompt, max_tokens), oldest first
+analysis_cache = {}
+
+def generate_analysis(llm_client, prompt, max_tokens, cached_prefix=None):
+    # Identical analysis and change-summary prompts (e.g. the same check re-run with
+    # unchanged output and context) reuse the earlier answer instead of another
+    # LLM round-trip. File rewrites don't come through here, so a retried rewrite
+    # still gets a fresh answer.
+    key = (hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest(), max_tokens)
+    if key in analysis_cache:
+        analysis_cache[key] = analysis_cache.pop(key)  # Mark as most recently used
+        return analysis_cache[key]
+    response = llm_client.generate_response(prompt, max_tokens, cached_prefix)
+    analysis_cache[key] = response
+    if len(analysis_cache) > ANALYSIS_CACHE_SIZE:
+        del analysis_cache[next(iter(analysis_cache))]
+    return response
+
+# Patterns for parsing the action response, compiled once instead of per iteration
+ACTION_PATTERN = re.compile(r'ACTION:\s*(.*)')
+REASON_PATTERN = re.compile(r'REASON:\s*(.*)')
+GOALS_PATTERN = re.compile(r'GOALS:\s*((?:\d+\.\s*.*\n?)+)', re.DOTALL)
+NOTES_PATTERN = re.compile(r'NOTES:\s*((?:\d+\.\s*.*\n?)+)', re.DOTALL)
+COT_PATTERN = re.compile(r'<CoT>(.*?)</CoT>', re.DOTALL)
 
 def generate_tree_structure(structure, prefix='', is_last=True):
     output = []
@@ -2344,12 +3465,31 @@ def generate_tree_structure(structure, prefix='', is_last=True):
     return output
 
 def get_tree_structure():
-    with open(PROJECT_STRUCTURE_FILE, 'r') as f:
-        structure = json.load(f)
+    structure = read_json_file(PROJECT_STRUCTURE_FILE)
     
     tree = ['.'] + generate_tree_structure(structure)
     return "\n".join(tree)
 
+# Serialized prompt sections, rebuilt only when their source data changes
+prompt_cache = {"structure": None, "tree": None, "history_len": None, "history_json": None}
+
+def refresh_project_structure():
+    # Only rewrite project_structure.json and re-render the tree when the layout changed
+    project_structure = generate_project_structure()
+    if project_structure != prompt_cache["structure"]:
+        save_project_structure(project_structure)
+        prompt_cache["structure"] = project_structure
+        prompt_cache["tree"] = "\n".join(['.'] + generate_tree_structure(project_structure))
+    # Hand back the cached object so callers can tell an unchanged layout by identity
+    return prompt_cache["structure"], prompt_cache["tree"]
+
+def get_last_n_iterations_json(command_history, count):
+    # command_history is append-only, so its length identifies the serialized tail
+    if prompt_cache["history_len"] != (len(command_history), count):
+        prompt_cache["history_json"] = compact_json(get_last_n_iterations(command_history, count))
+        prompt_cache["history_len"] = (len(command_history), count)
+    return prompt_cache["history_json"]
+
 
     """
     Process LLM's modification commands and apply them to the file content.
@@ -2690,6 +3830,60 @@ def process_file_modifications(file_content, llm_response):
         return file_content, error, error
     return apply_modifications(file_content, commands)
 
+# Follow-up prompts for analysing an action's result; they start with the action
+# prompt so the shared prefix can be served from the prompt cache
+CHECK_ANALYSIS_TEMPLATE = """{prompt}
+<PREVIOUS_PROMPT_END>
+
+You requested to check this command: {action}.
+
+You gave this reason: {reason}
+
+You set these goals: {goals}
+
+Check result:
+{output}
+
+This is for the result section of this command. Analyze the check result and determine if further action is needed. Respond in 100 words or less:
+"""
+
+RUN_ANALYSIS_TEMPLATE = """{prompt}
+<PREVIOUS_PROMPT_END>
+
+You requested to run this command: {action}.
+
+You gave this reason: {reason}
+
+You set these goals: {goals}
+
+Chain of Thought for this action: {cot}
+
+Output:
+{output}
+
+Execution {status}
+
+This is for the result section of this command. Respond based on the command execution in 200 words or less (lesser the better). Provide specifics on the success of the command, any errors encountered, and the next steps based on the output. If a test was run, provide the results and any debugging steps (with errors in specific files and lines) trying to fix issues one by one:
+"""
+
+UI_ANALYSIS_TEMPLATE = """{prompt}
+<PREVIOUS_PROMPT_END>
+
+You executed a UI action: {action}
+
+You gave this reason: {reason}
+
+You set these goals: {goals}
+
+Chain of Thought for this action: {cot}
+
+The result was: {status}
+
+Output: {output}
+
+Based on this result, provide a brief analysis (max 100 words) of what happened and what should be done next in the UI testing process:
+"""
+
 def test_and_debug_mode(llm_client):
     global unchanged_files, last_inspected_files, user_suggestion, WRITE_MODE, MAX_FILE_LENGTH
 
@@ -2700,9 +3894,10 @@ def test_and_debug_mode(llm_client):
 
     # Add this function to handle unexpected terminations
     def handle_unexpected_termination(signum, frame):
-        print("Unexpected termination detected. Saving current state...")
-        save_command_history(command_history)
-        sys.exit(1)
+        if shutdown_requested.is_set():
+            sys.exit(1)  # Repeated SIGTERM: stop waiting for the main loop
+        # Saving and cleanup happen in the main loop, not inside the handler
+        shutdown_requested.set()
 
     # Register the signal handler
     signal.signal(signal.SIGTERM, handle_unexpected_termination)
@@ -2716,6 +3911,7 @@ def test_and_debug_mode(llm_client):
         project_summary = "No project summary found"
 
     technical_brief = load_technical_brief()
+    technical_brief_index = build_file_index(technical_brief.get("directories", {}))
     directory_summaries = technical_brief.get("directory_summaries", {})
     project_structure = read_project_structure()
     test_progress = load_test_progress()
@@ -2728,7 +3924,7 @@ def test_and_debug_mode(llm_client):
     # print(f"Completed tests: {test_progress['completed_tests']}")
     # print(f"Current step: {test_progress['current_step']}")
     # print(f"Command history: {json.dumps(command_history, indent=2)}")
-    print(f"History brief: {json.dumps(history_brief, indent=2)}")
+    print(f"History brief: {pretty_json(history_brief)}")
 
     iteration = len(command_history) + 1
     start_iteration = iteration
@@ -2747,21 +3943,31 @@ def test_and_debug_mode(llm_client):
 
     global HasUserInterrupted
     def handle_interrupt(signum, frame):
-        global HasUserInterrupted, user_suggestion
-        if HasUserInterrupted:
+        if HasUserInterrupted or interrupt_requested.is_set():
             print("\nSecond Ctrl+C received. Exiting the program.")
-            kill_all_processes()
-            sys.exit(0)
-        HasUserInterrupted = True
-        user_suggestion = handle_user_suggestion()
+            sys.exit(0)  # kill_all_processes runs from atexit
+        # Only record the interrupt; the main loop asks for the suggestion
+        interrupt_requested.set()
+
+    def handle_pending_signals():
+        global HasUserInterrupted, user_suggestion
+        if shutdown_requested.is_set():
+            print("Unexpected termination detected. Saving current state...")
+            save_command_history(command_history)
+            sys.exit(1)
+        if interrupt_requested.is_set():
+            HasUserInterrupted = True
+            interrupt_requested.clear()
+            user_suggestion = handle_user_suggestion()
 
     # Set up the signal handler
     signal.signal(signal.SIGINT, handle_interrupt)
 
     retry_with_expert = False
 
-    global unchanged_files, last_chat_content, chat_updated, chat_updated_iteration
+    global unchanged_files, unchanged_files_tick, last_chat_content, chat_updated, chat_updated_iteration
     last_chat_content = read_chat_file()
+    start_chat_watcher()
 
     # Previous action analysis
     previous_action_analysis = None
@@ -2781,8 +3987,13 @@ def test_and_debug_mode(llm_client):
     # Append this to the command history as the first message
     command_history.append({"user_message": user_session_message})
     save_command_history(command_history)
+
+    # The command lists in the action menu are fixed for the session
+    allowed_commands_text = ', '.join(ALLOWED_COMMANDS)
+    approval_commands_text = ', '.join(APPROVAL_REQUIRED_COMMANDS)
     
     while True:
+        handle_pending_signals()
         # Check for chat updates at the start of each iteration
         # check_all_processes()
         retry_with_expert = False
@@ -2790,10 +4001,8 @@ def test_and_debug_mode(llm_client):
         # if HasUserInterrupted:
         #     user_suggestion = handle_user_suggestion()
 
-        # Update project structure after every iteration (need optimized)
-        project_structure = generate_project_structure()
-        save_project_structure(project_structure)
-        directory_tree_structure = get_tree_structure()
+        # Update project structure after every iteration
+        project_structure, directory_tree_structure = refresh_project_structure()
 
         if check_chat_updates():
             chat_updated_iteration = iteration
@@ -2801,7 +4010,7 @@ def test_and_debug_mode(llm_client):
             wait_for_user_input()
 
         last_actions_context_count = 20
-        last_n_iterations = get_last_n_iterations(command_history, last_actions_context_count)
+        last_n_iterations_json = get_last_n_iterations_json(command_history, last_actions_context_count)
 
         # Update history brief every 10 iterations
         if relative_iteration % UPDATE_INTERVAL == 9:
@@ -2812,14 +4021,25 @@ def test_and_debug_mode(llm_client):
         # Collect information about running processes and their latest output
         process_status = []
         process_outputs = []
-        for process_info in running_processes[:]:  # Use a copy of the list to safely modify it
-            status, output = check_process_output(process_info["cmd"])
-            if "has terminated" in status:
-                print(status)
+        exited_processes = []
+        # Shared across processes so many INDEF processes can't bloat the prompt
+        process_output_budget = PROCESS_OUTPUT_PROMPT_BUDGET
+        for process_info in running_processes:
+            output = poll_process_output(process_info)
+            if output is None:
+                print(f"Process '{process_info['cmd']}' has terminated.")
+                exited_processes.append(process_info)
                 continue  # Skip terminated processes
-            process_status.append(status)
+            process_status.append(process_info["cmd"])
             if output:
-                process_outputs.append(f"Latest output from '{process_info['cmd']}':\n{output[-3000:]}")
+                if process_output_budget > 0:
+                    output = output[-process_output_budget:]
+                    process_output_budget -= len(output)
+                    process_outputs.append(f"Latest output from '{process_info['cmd']}':\n{output}")
+                else:
+                    process_outputs.append(f"Output from '{process_info['cmd']}' omitted (prompt budget reached).")
+        for process_info in exited_processes:
+            unregister_process(process_info)
 
         history_brief_prompt = get_history_brief_for_prompt(history_brief)
 
@@ -2840,7 +4060,7 @@ Action history brief:
 {history_brief_prompt}
 
 Last {last_actions_context_count} actions:
-{json.dumps(last_n_iterations, indent=2)}
+{last_n_iterations_json}
 
 {f"Currently running processes (make sure the ones needed are running): {', '.join(process_status)}" if process_status else "No running processes."}
 
@@ -2867,8 +4087,8 @@ CRITICAL: Use the previous actions (especially the most recent action) and notes
 
 You can take the following actions:
 
-1. Run a command/test from {', '.join(ALLOWED_COMMANDS)} or {', '.join(APPROVAL_REQUIRED_COMMANDS)} syncronously (blocking), use: "RUN: {', '.join(ALLOWED_COMMANDS)}". The script will wait for the command to finish and provide you with the output.
-2. Run a command/test from {', '.join(ALLOWED_COMMANDS)} or {', '.join(APPROVAL_REQUIRED_COMMANDS)} asyncronously (non-blocking), use: "INDEF: <command>". This will run the command in the background and provide you with the initial output.
+1. Run a command/test from {allowed_commands_text} or {approval_commands_text} syncronously (blocking), use: "RUN: {allowed_commands_text}". The script will wait for the command to finish and provide you with the output.
+2. Run a command/test from {allowed_commands_text} or {approval_commands_text} asyncronously (non-blocking), use: "INDEF: <command>". This will run the command in the background and provide you with the initial output.
 3. Run a raw command that requires approval, use: "RAW: <raw_command>". This will run the command in the shell and provide you with the output. You can use this for any command that is not in the allowed list.
 4. Check the output of a running process using "CHECK: <command>"
 5. Inspect up to four files in the project structure by replying with "INSPECT: <file_path>, <file_path>, ..." and get the analysis of the files based on the reason and goals.
@@ -2902,10 +4122,6 @@ What would you like to do next to complete the user's task? Once the user task i
         # else:
         final_prompt = prompt # + prompt_extension
 
-        HasUserInterrupted = False
-        ModifiedFile = False
-        previous_action_analysis = None
-        previous_file_diff = None
         # For debug, print the process outputs been provided
         print(f"Running processes for debug: {process_status}")
         print(f"Process outputs for debug: {process_outputs}")
@@ -2914,15 +4130,26 @@ What would you like to do next to complete the user's task? Once the user task i
         print(f"\nGenerating next step (Iteration {iteration})...")
         # Print the prompt for the user
         # print(final_prompt)
-        response = llm_client.generate_response(final_prompt, 4000)
+        # The analysis prompts below start with this prompt, so let them reuse its cache entry
+        response = generate_response_interruptible(llm_client, final_prompt, 4000, cached_prefix=final_prompt)
+        if response is None:
+            print("\nLLM request interrupted.")
+            continue  # The pending signal is handled at the top of the loop
         print(f"LLM response:\n{response}")
 
+        # The previous action's results have been sent; only clear them now, so an
+        # interrupted request is re-issued with them
+        HasUserInterrupted = False
+        ModifiedFile = False
+        previous_action_analysis = None
+        previous_file_diff = None
+
         # Parse the response
-        action_match = re.search(r'ACTION:\s*(.*)', response)
-        reason_match = re.search(r'REASON:\s*(.*)', response)
-        goals_match = re.search(r'GOALS:\s*((?:\d+\.\s*.*\n?)+)', response, re.DOTALL)
-        notes_match = re.search(r'NOTES:\s*((?:\d+\.\s*.*\n?)+)', response, re.DOTALL)
-        cot_match = re.search(r'<CoT>(.*?)</CoT>', response, re.DOTALL)
+        action_match = ACTION_PATTERN.search(response)
+        reason_match = REASON_PATTERN.search(response)
+        goals_match = GOALS_PATTERN.search(response)
+        notes_match = NOTES_PATTERN.search(response)
+        cot_match = COT_PATTERN.search(response)
         command_entry = {"count": iteration}
 
         if action_match:
@@ -2943,28 +4170,30 @@ What would you like to do next to complete the user's task? Once the user task i
                 new_notes = notes_match.group(1).strip()
                 command_entry["notes_updated"] = True 
                 update_notes(new_notes)
-                print(f"Updated notes:\n{json.dumps(llm_notes, indent=2)}")
+                print(f"Updated notes:\n{pretty_json(llm_notes)}")
 
-            if action.upper().startswith("NOTES:"):
+            # Upper-cased once for the whole dispatch chain below
+            action_upper = action.upper()
+            if action_upper.startswith("NOTES:"):
                 new_notes = action.split(":", 1)[1].strip()
                 update_notes(new_notes)
-                print(f"Updated notes:\n{json.dumps(llm_notes, indent=2)}")
+                print(f"Updated notes:\n{pretty_json(llm_notes)}")
                 command_entry["notes_updated"] = True
 
-            elif action.upper().startswith("CHAT:"):
+            elif action_upper.startswith("CHAT:"):
                 question = action.split(":")[1].strip()
                 print(f"\nAsking for help with the question: {question}")
                 user_response = input("Please provide your response to the model's question: ")        
                 command_entry["user"] = user_response
 
-            elif action.upper().startswith("INSPECT:"):
+            elif action_upper.startswith("INSPECT:"):
                 file_paths = action.split(":")[1].strip()
                 try:
                     inspect_files = [f.strip() for f in file_paths.split(",")]
                     file_contents = {}
 
                     # Check if the current set of files is the same as the last inspected set
-                    if set(inspect_files) == set(last_inspected_files) and (iteration - last_unsuccessful_inspection_iteration) == 1:
+                    if frozenset(inspect_files) == last_inspected_files and (iteration - last_unsuccessful_inspection_iteration) == 1:
                         last_unsuccessful_inspection_iteration = iteration
                         error_msg = "Error: Cannot inspect the same set of files consecutively. Please include at least one different file."
                         print(error_msg)
@@ -2975,19 +4204,19 @@ What would you like to do next to complete the user's task? Once the user task i
                         continue
 
                     # Update the last_inspected_files
-                    last_inspected_files = inspect_files
+                    last_inspected_files = frozenset(inspect_files)
 
-                    for file_path in inspect_files:
-                        if not os.path.exists(file_path):
+                    for file_path, content in read_files(inspect_files).items():
+                        if content is None:
                             error_msg = f"Error: File not found: {file_path}"
                             print(error_msg)
                             file_contents[file_path] = error_msg
                         else:
-                            file_contents[file_path] = read_file(file_path)
+                            file_contents[file_path] = clip_content(content)
 
-                    inspection_prompt = f"""
-<PREVIOUS_PROMPT_START>
-{prompt}
+                    # The prompt is assembled from parts and joined once, since prompt
+                    # itself is large and each += would copy it again
+                    inspection_parts = [f"""{prompt}
 <PREVIOUS_PROMPT_END>
 
 This is the action executor system for your action selection as included before this text (only use the that as context and don't chose a action).
@@ -3003,21 +4232,21 @@ Chain of Thought for this action: {cot_match}
 Inspect for dependencies between the files. Check that variables, functions, parameters, and return values are used correctly and consistently across the files.
 
 Inspected files:
-                    """
+                    """]
 
-                    for file_path, content in file_contents.items():
-                        inspection_prompt += f"""
+                    inspection_parts.extend(f"""
                         File: {file_path}
                         <FILE_CONTENT>
                         {content}
                         </FILE_CONTENT>
-                        """
+                        """ for file_path, content in file_contents.items())
 
-                    inspection_prompt += """
+                    inspection_parts.append("""
                     Respond to yourself in 100 words or less with the results of the inspection. This is for the result section of this command, provide specific instructions to yourself for the next step such as specific changes in the code. If no improvements are needed, state that the files are ready for testing, or provide debug notes:
-                    """
+                    """)
+                    inspection_prompt = "".join(inspection_parts)
 
-                    analysis = llm_client.generate_response(inspection_prompt, 4000)
+                    analysis = generate_analysis(llm_client, inspection_prompt, 4000, cached_prefix=prompt)
                     previous_action_analysis = analysis
                     print(f"Files analysis:\n{analysis}")
 
@@ -3034,7 +4263,7 @@ Inspected files:
                     command_entry["error"] = error_msg
                     wait_for_user()
 
-            elif action.upper().startswith("REWRITE:"):
+            elif action_upper.startswith("REWRITE:"):
                 file_path = action.split(":")[1].strip()
                 if not os.path.exists(file_path):
                     error_msg = f"Error: File not found: {file_path}\n You cannot create a new file. Try to implement the functionality in an existing file in the project structure or ask user for help."
@@ -3044,8 +4273,8 @@ Inspected files:
                     save_command_history(command_history)
                     iteration += 1
                     continue
-                current_content = read_file(file_path)
-                file_brief = get_file_technical_brief(technical_brief, file_path)
+                current_content = read_file_cached(file_path)
+                file_brief = get_file_technical_brief(technical_brief, file_path, technical_brief_index)
                 modification_prompt = f"""
                 {prompt}
 
@@ -3079,7 +4308,7 @@ Inspected files:
 
                 Goals given for this action: {goals}
 
-                Command history (last 10 commands) for better context: {json.dumps(last_n_iterations, indent=2)}
+                Command history (last 10 commands) for better context: {last_n_iterations_json}
 
                 Summarize the changes made to the file {file_path}. Compare the original content:
                 {current_content}
@@ -3089,7 +4318,7 @@ Inspected files:
 
                 This is for the result section of this command. Provide a brief summary of the modifications in 50 words or less and if the goals were achieved.
                 """
-                changes_summary = llm_client.generate_response(changes_prompt, 1000)
+                changes_summary = generate_analysis(llm_client, changes_prompt, 1000)
                 print(f"Changes summary:\n{changes_summary}")
                 
                 # technical_brief = update_technical_brief(file_path, extracted_content, iteration, mode="test", test_info=changes_summary)
@@ -3105,14 +4334,17 @@ Inspected files:
                 #         llm_client.switch_model("claude-3-opus@20240229")
                 #     continue
 
-            elif action.upper().startswith("READ:"):
+            elif action_upper.startswith("READ:"):
                 parts = action.split(";")
                 inspect_files = [f.strip() for f in parts[0].split(":")[1].split(",")]
                 write_file = parts[1].split(":")[1].strip()
 
                 # Check if the file is in the unchanged_files list and still under constraint
-                if write_file in unchanged_files and unchanged_files[write_file] > 0:
-                    error_msg = f"Error: The file {write_file} cannot be modified for {unchanged_files[write_file]} more iterations (this iteration won't count) due to no changes in the previous attempt. Use other actions such as INSPECT to increase the count."
+                remaining = unchanged_files.get(write_file, 0) - unchanged_files_tick
+                if write_file in unchanged_files and remaining <= 0:
+                    del unchanged_files[write_file]
+                if remaining > 0:
+                    error_msg = f"Error: The file {write_file} cannot be modified for {remaining} more iterations (this iteration won't count) due to no changes in the previous attempt. Use other actions such as INSPECT to increase the count."
                     previous_action_analysis = error_msg
                     command_entry["error"] = error_msg
                     print(error_msg)
@@ -3136,8 +4368,10 @@ Inspected files:
                     continue
 
                 file_contents = {}
-                for file_path in inspect_files:
-                    if not os.path.exists(file_path):
+                # Unnumbered, untruncated contents, for comparing against what gets written
+                raw_contents = {}
+                for file_path, content in read_files(inspect_files).items():
+                    if content is None:
                         error_msg = f"Error: File not found: {file_path}"
                         file_contents[file_path] = error_msg
                         if "error" not in command_entry:
@@ -3145,7 +4379,7 @@ Inspected files:
                         else:
                             command_entry["error"] += error_msg
                     else:
-                        content = read_file(file_path)
+                        raw_contents[file_path] = content
                         content = add_line_numbers(content)
                         content = truncate_content(content, MAX_FILE_LENGTH)
                         file_contents[file_path] = content
@@ -3160,6 +4394,7 @@ Inspected files:
                         open(write_file, 'w').close()
                         print(f"Created new file: {write_file}")
                         file_contents[write_file] = ""  # Add empty content to file_contents
+                        raw_contents[write_file] = ""
 
                         # Update project structure
                         update_project_structure(write_file)
@@ -3174,9 +4409,8 @@ Inspected files:
                         iteration += 1
                         continue
 
-                inspection_prompt = f"""
-<PREVIOUS_PROMPT_START>
-{prompt}
+                # Assembled from parts and joined once the instructions for the write mode are known
+                inspection_parts = [f"""{prompt}
 <PREVIOUS_PROMPT_END>
 
 This is the action executor system for your action selection as appended before this text (only use the that as context and don't chose a action).
@@ -3184,17 +4418,16 @@ This is the action executor system for your action selection as appended before
 You chose to inspect multiple files and modify one of them.
 
 Files to be thoroughly analysed and inspected to modify {write_file} file:
-                """
+                """]
 
-                for file_path, content in file_contents.items():
-                    inspection_prompt += f"""
+                inspection_parts.extend(f"""
 <FILE_START({file_path})>
 {content}
 <FILE_END({file_path})>
-"""
+""" for file_path, content in file_contents.items())
                 print(f"WRITE_MODE: {WRITE_MODE}")
                 if WRITE_MODE == "direct":
-                    inspection_prompt += f"""
+                    inspection_parts.append(f"""
 Use the contents of the provided files to modify the file {write_file}, consider the previous action, reason and goals for the modification. Use chain of thought to make the modifications.
 
 {"Previous action result/analysis: " + previous_action_analysis if previous_action_analysis else ""}
@@ -3206,7 +4439,8 @@ Goals for this action: {goals}
 Chain of Thought for this action: {cot_match}
 
 Please provide the complete updated content for the file {write_file}, addressing any issues or improvements needed based on your inspection of all the files, while keeping code CONSISTENT across files, you must not make an unnecessary changes to the code. Never remove features unless specified. You must provide the full content since your output is directly written to the file without processing. Your output should be valid content for the file being written to. If you need to include any explanations, please do so as comments within the code. Remember, you're directly writing to the file!
-                    """
+                    """)
+                    inspection_prompt = "".join(inspection_parts)
                     # Use the following format to provide changes for the file. There should be no other content in your response, only changes to the file content:
                     # - To add a line after a line number: +<line_number>:new_content
                     # - To remove a line: -<line_number>
@@ -3214,9 +4448,9 @@ Please provide the complete updated content for the file {write_file}, addressin
 
                     # If retry_with_expert is set, token = 4096, else 8192
                     if retry_with_expert:
-                        new_content = llm_client.generate_response(inspection_prompt, 4096)
+                        new_content = llm_client.generate_response(inspection_prompt, 4096, cached_prefix=prompt)
                     else:
-                        new_content = llm_client.generate_response(inspection_prompt, 8192)
+                        new_content = llm_client.generate_response(inspection_prompt, 8192, cached_prefix=prompt)
 
                     # new_content = llm_client.generate_response(inspection_prompt, )  # Increased token limit for multiple files
                     extracted_content = extract_content(new_content, write_file)
@@ -3237,8 +4471,8 @@ Please provide the complete updated content for the file {write_file}, addressin
                         print("Warning: No actual changes were made in this iteration.")
                         command_entry["result"] = {"warning": "No actual changes were made in this iteration. Use INSPECT to check what changes are needed."}
 
-                        # Add the file to unchanged_files with a counter of 2
-                        unchanged_files[write_file] = 2
+                        # Block the file for the next 2 ticks
+                        unchanged_files[write_file] = unchanged_files_tick + 2
 
                         command_entry["error"] = f"The file {write_file} cannot be modified for the next 2 successful iterations due to no changes in this attempt. Use INSPECT to increase the count."
 
@@ -3258,17 +4492,17 @@ Please provide the complete updated content for the file {write_file}, addressin
 
                     Chain of Thought for this action: {cot_match}
 
-                    Command history (last 10 commands) for better context: {json.dumps(last_n_iterations, indent=2)}
+                    Command history (last 10 commands) for better context: {last_n_iterations_json}
 
                     Summarize the changes made to the file {write_file} for future notes to yourself. Compare the original content:
-                    {read_file(write_file)}
+                    {raw_contents[write_file]}
 
                     With the new content:
                     {extracted_content}
 
                     This is for the result section of this command. Provide a brief summary of the modifications and if the goals were achieved in 100 words or less:
                     """
-                    changes_summary = llm_client.generate_response(changes_prompt, 1000)
+                    changes_summary = generate_analysis(llm_client, changes_prompt, 1000)
                     print(f"\nModified {write_file}")
                     ModifiedFile = True
                     
@@ -3277,7 +4511,7 @@ Please provide the complete updated content for the file {write_file}, addressin
                     
                     command_entry["result"] = {"changes_summary": changes_summary}
                 else:
-                    inspection_prompt += f"""
+                    inspection_parts.append(f"""
 Use the contents of the provided files to modify the file {write_file}, consider the previous action, reason and goals for the modification. Use chain of thought to make the modifications.
 {"{NEWLINE}Previous action result/analysis: " + previous_action_analysis + "{NEWLINE}" if previous_action_analysis else ""}
 Reason for this action: {reason}
@@ -3292,16 +4526,17 @@ To remove lines, provide start and end line numbers, separated by a dash. If sta
 To modify content, provide the line number range and the new content: MODIFY <line_number_start>-<line_number_end>:<CONTENT_START>new_content<CONTENT_END>
 
 Remember to use ONLY ONE TYPE of keyword (only ADD(s) or only REMOVE(s) or only MODIFY(s)) and only provide the changes for the file to save tokens.
-                    """
+                    """)
+                    inspection_prompt = "".join(inspection_parts)
                     #print(f"Inspection prompt:\n{inspection_prompt}")
                     if retry_with_expert:
-                        llm_response = llm_client.generate_response(inspection_prompt, 4096)
+                        llm_response = llm_client.generate_response(inspection_prompt, 4096, cached_prefix=prompt)
                     else:
-                        llm_response = llm_client.generate_response(inspection_prompt, 8192)
+                        llm_response = llm_client.generate_response(inspection_prompt, 8192, cached_prefix=prompt)
                     #print(f"LLM response:\n{llm_response}")
 
                     # Process the modifications using existing functions
-                    current_content = read_file(write_file)
+                    current_content = read_file_cached(write_file)
                     modified_content, changes_summary, Error_in_modifications = process_file_modifications(current_content, llm_response)
                     if Error_in_modifications:
                         print(f"Error in modifications: {Error_in_modifications}")
@@ -3317,8 +4552,8 @@ Remember to use ONLY ONE TYPE of keyword (only ADD(s) or only REMOVE(s) or only
                         print("Warning: No actual changes were made in this iteration.")
                         command_entry["result"] = {"warning": "No actual changes were made in this iteration. Use INSPECT to check what changes are needed."}
 
-                        # Add the file to unchanged_files with a counter of 2
-                        unchanged_files[write_file] = 2
+                        # Block the file for the next 2 ticks
+                        unchanged_files[write_file] = unchanged_files_tick + 2
 
                         command_entry["error"] = f"The file {write_file} cannot be modified for the next 2 successful iterations due to no changes in this attempt. Use INSPECT to increase the count."
 
@@ -3342,7 +4577,7 @@ Goals given for this action: {goals}
 
 Chain of Thought for this action: {cot_match}
 
-Command history (last 10 commands) for better context: {json.dumps(last_n_iterations, indent=2)}
+Command history (last 10 commands) for better context: {last_n_iterations_json}
 
 Summarize the changes made to the file {write_file} for future notes to yourself. Compare the original content:
 {current_content}
@@ -3352,7 +4587,7 @@ With the new content:
 
 This is for the result section of this command. Provide a brief summary of the modifications and if the goals were achieved in 100 words or less:
                     """
-                    changes_summary = llm_client.generate_response(changes_prompt, 1000)
+                    changes_summary = generate_analysis(llm_client, changes_prompt, 1000)
                     previous_action_analysis = changes_summary
                     print(f"Changes summary:\n{changes_summary}")
                     
@@ -3368,76 +4603,62 @@ This is for the result section of this command. Provide a brief summary of the m
                 #         llm_client.switch_model("claude-3-opus@20240229")
                 #     continue
 
-            elif action.upper() == "DONE":
+            elif action_upper == "DONE":
                 print("\nTest and debug mode completed.")
                 command_entry["result"] = "Test and debug mode completed."
                 break
 
             # Handle raw commands
-            elif action.upper().startswith("RAW:"):
+            elif action_upper.startswith("RAW:"):
                 print(f"\nExecuting raw command: {action}")
                 output, success = execute_command(action)
                 print(f"Command output:\n{output}")
                 update_test_progress(completed_test=action, current_step=f"Executed raw command: {action}")
 
-                command_entry["output"] = output[:12000] if len(output) < 12000 else "Output truncated due to length"
+                command_entry["output"] = truncate_output(output)
                 previous_action_analysis = output
                 command_entry["success"] = success
 
-            elif action.upper().startswith("INDEF:"):
+            elif action_upper.startswith("INDEF:"):
                 print(f"\nExecuting command: {action}")
                 output, success = execute_command(action)
                 print(f"Command output:\n{output}")
                 update_test_progress(completed_test=action, current_step=f"Executed {action}")
 
-                command_entry["output"] = output[:12000] if len(output) < 12000 else "Output truncated due to length"
+                command_entry["output"] = truncate_output(output)
                 command_entry["success"] = success
 
                 previous_action_analysis = output
 
             # Analysis step for CHECK commands
-            elif action.upper().startswith("CHECK:"):
+            elif action_upper.startswith("CHECK:"):
                 print(f"\nChecking: {action}")
                 output, success = execute_command(action)
-                analysis_prompt = f"""
-                <PREVIOUS_PROMPT>
-                {prompt}
-                </PREVIOUS_PROMPT>
-
-                You requested to check this command: {action}.
-
-                You gave this reason: {reason}
-
-                You set these goals: {goals}
-
-                Check result:
-                {output}
-
-                This is for the result section of this command. Analyze the check result and determine if further action is needed. Respond in 100 words or less:
-                """
-                analysis = llm_client.generate_response(analysis_prompt, 1000)
+                analysis_prompt = CHECK_ANALYSIS_TEMPLATE.format(
+                    prompt=prompt, action=action, reason=reason, goals=goals, output=summarize_output(output))
+                analysis = generate_analysis(llm_client, analysis_prompt, 1000, cached_prefix=prompt)
 
                 previous_action_analysis = analysis
                 print(f"Check analysis:\n{analysis}")
                 command_entry["analysis"] = analysis
             
-            elif action.upper().startswith("RESTART:"):
+            elif action_upper.startswith("RESTART:"):
                 cmd = action.split(":", 1)[1].strip()
                 output = restart_process(cmd)
                 print(output)
                 command_entry["result"] = {"restart_output": output}
 
-            elif action.upper().startswith("RUN:"):
+            elif action_upper.startswith("RUN:"):
                 action = action[4:].strip()
                 # if the command is not in the ALLOWED_COMMANDS or APPROVAL_REQUIRED_COMMANDS, then it is not allowed to run
-                if not any(action.startswith(cmd) for cmd in ALLOWED_COMMANDS + APPROVAL_REQUIRED_COMMANDS):
+                if not RUNNABLE_COMMAND_PATTERN.match(action):
                     print(f"Command not allowed: {action}")
                     command_entry["error"] = f"Command not allowed: {action}. Please ask the user to add this command to the ALLOWED_COMMANDS list."
                     command_history.append(command_entry)
                     save_command_history(command_history)
                     iteration += 1
                     continue
-                if any(action.startswith(cmd) for cmd in ALLOWED_COMMANDS + APPROVAL_REQUIRED_COMMANDS):
+                if RUNNABLE_COMMAND_PATTERN.match(action):
                     env_check, env_output = check_environment(action)
                     if env_check:
                         print(f"\nExecuting command: {action}")
@@ -3445,34 +4666,15 @@ This is for the result section of this command. Provide a brief summary of the m
                         print(f"Command output:\n{output}")
                         update_test_progress(completed_test=action, current_step=f"Executed {action}")
 
-                        if "This command appears to start a long-running process" in output:
+                        if output == LONG_RUNNING_SUGGESTION:
                             command_entry["suggestion"] = output
                         else:                      
-                            analysis_prompt = f"""
-                            <PREVIOUS_PROMPT>
-                            {prompt}
-                            </PREVIOUS_PROMPT>
-
-                            You requested to run this command: {action}.
-
-                            You gave this reason: {reason}
-
-                            You set these goals: {goals}
-
-                            Chain of Thought for this action: {cot_match}
-
-                            Output:
-                            {output}
-
-                            Execution {'succeeded' if success else 'failed'}
-
-                            This is for the result section of this command. Respond based on the command execution in 200 words or less (lesser the better). Provide specifics on the success of the command, any errors encountered, and the next steps based on the output. If a test was run, provide the results and any debugging steps (with errors in specific files and lines) trying to fix issues one by one:
-                            """
-                            analysis = llm_client.generate_response(analysis_prompt, 1000)
+                            analysis_prompt = RUN_ANALYSIS_TEMPLATE.format(
+                                prompt=prompt, action=action, reason=reason, goals=goals, cot=cot_match,
+                                output=summarize_output(output), status='succeeded' if success else 'failed')
+                            analysis = generate_analysis(llm_client, analysis_prompt, 1000, cached_prefix=prompt)
                             print(f"Command analysis:\n{analysis}")
-                            # Only add the command output if the length is less than 250 characters
-                            if len(output) < 12000:
-                                command_entry["output"] = output
+                            command_entry["output"] = truncate_output(output)
                             command_entry["success"] = success
                             command_entry["analysis"] = analysis
                     else:
@@ -3482,36 +4684,20 @@ This is for the result section of this command. Provide a brief summary of the m
                         command_entry["result"] = {"error": error_msg, "env_output": env_output}
                         wait_for_user()
 
-            elif action.upper().startswith(("UI_OPEN:", "UI_CLICK:", "UI_CHECK_TEXT:", "UI_CHECK_LOG:")):
+            elif action_upper.startswith(("UI_OPEN:", "UI_CLICK:", "UI_CHECK_TEXT:", "UI_CHECK_LOG:")):
                 print(f"\nExecuting UI action: {action}")
                 output, success = handle_ui_action(action)
                 print(f"Action output:\n{output}")
                 update_test_progress(completed_test=action, current_step=f"Executed UI action: {action}")
-                command_entry["output"] = output[:12000] if len(output) < 12000 else "Output truncated due to length"
+                command_entry["output"] = truncate_output(output)
                 previous_action_analysis = output
                 command_entry["success"] = success
 
                 # Add UI-specific analysis
-                ui_analysis_prompt = f"""
-                <PREVIOUS_PROMPT>
-                {prompt}
-                </PREVIOUS_PROMPT>
-
-                You executed a UI action: {action}
-
-                You gave this reason: {reason}
-
-                You set these goals: {goals}
-
-                Chain of Thought for this action: {cot_match}
-                
-                The result was: {"successful" if success else "unsuccessful"}
-                
-                Output: {output}
-                
-                Based on this result, provide a brief analysis (max 100 words) of what happened and what should be done next in the UI testing process:
-                """
-                ui_analysis = llm_client.generate_response(ui_analysis_prompt, 1000)
+                ui_analysis_prompt = UI_ANALYSIS_TEMPLATE.format(
+                    prompt=prompt, action=action, reason=reason, goals=goals, cot=cot_match,
+                    output=summarize_output(output), status="successful" if success else "unsuccessful")
+                ui_analysis = generate_analysis(llm_client, ui_analysis_prompt, 1000, cached_prefix=prompt)
                 command_entry["ui_analysis"] = ui_analysis
                 print(f"UI Action Analysis:\n{ui_analysis}")
 
@@ -3530,13 +4716,9 @@ This is for the result section of this command. Provide a brief summary of the m
         JustStarted = False
         test_progress = load_test_progress()
         iteration += 1
-        save_command_history(command_history)
 
-        # Decrease the counter for unchanged files at the end of each iteration
-        for file in list(unchanged_files.keys()):
-            unchanged_files[file] -= 1
-            if unchanged_files[file] == 0:
-                del unchanged_files[file]
+        # One tick per iteration; expired unchanged_files entries are dropped when next checked
+        unchanged_files_tick += 1
 
         #if retry_with_expert:
         #    # Switch back
@@ -3586,6 +4768,61 @@ def update_file_entry(directories, file_path, file_entry):
     else:
         current_dir["files"].append(file_entry)
 
+def generate_file_contents_batch(jobs, project_summary, iteration, max_iterations):
+    # Send the content prompts for all files in one provider batch. Prompts that are
+    # already in the response cache are left out and served from it instead.
+    prompts = {}
+    cache_paths = {}
+    for index, (file_path, file_entry, context, previous_content) in enumerate(jobs):
+        prompt = build_file_content_prompt(file_path, project_summary, context, previous_content, iteration, max_iterations)
+        cache_path = response_cache_path(llm_client, prompt, 4000)
+        if not RESPONSE_CACHE_ENABLED or not os.path.exists(cache_path):
+            prompts[f"file-{index}"] = prompt
+            cache_paths[f"file-{index}"] = cache_path
+    if not prompts:
+        return {}
+    try:
+        responses = llm_client.generate_responses_batch(prompts, 4000, cached_prefix=build_file_content_prefix(project_summary))
+    except Exception as e:
+        print(f"Batch request failed, falling back to individual requests: {str(e)}")
+        return {}
+    # Responses that don't extract cleanly are neither cached nor used, so those
+    # files fall back to an individual request
+    complete_responses = {}
+    for custom_id, response in responses.items():
+        file_path = jobs[int(custom_id.split("-")[1])][0]
+        try:
+            extract_complete_content(response, file_path)
+        except ValueError as e:
+            print(str(e))
+            continue
+        complete_responses[custom_id] = response
+        if RESPONSE_CACHE_ENABLED:
+            store_cached_response(cache_paths[custom_id], response)
+    return complete_responses
+
+def generate_file(file_path, project_summary, context, previous_content, iteration, max_iterations, response_text=None):
+    # Runs on the generate() thread pool: both LLM calls for a file (its content and,
+    # unless the file is small enough to be briefed in a batch, its technical brief
+    # entry) happen here so they overlap with other files.
+    # response_text is the content response when it already came back from a batch.
+    if response_text is None:
+        content = get_file_content(file_path, project_summary, context, previous_content, iteration, max_iterations)
+    else:
+        content = extract_content(response_text, file_path)
+    if not content:
+        return content, None
+    if len(content) <= BRIEF_BATCH_FILE_MAX_CHARS:
+        # Small files are briefed together by generate() once all content is back
+        return content, None
+    try:
+        brief_content = generate_file_brief(file_path, content)
+    except Exception as e:
+        # update_technical_brief retries on the main thread and records the error
+        print(f"Error generating technical brief for {file_path}: {str(e)}")
+        brief_content = None
+    return content, brief_content
+
 def generate():
 
     def handle_interrupt(signum, frame):
@@ -3610,7 +4847,7 @@ def generate():
 
         if suggested_structure:
             print("Suggested project structure:")
-            print(json.dumps(suggested_structure, indent=2))
+            print(pretty_json(suggested_structure))
             print("\nExplanation:")
             print(explanation)
             
@@ -3627,8 +4864,7 @@ def generate():
                 remove_old_structure(preserve_files)
                 
                 # Save the new structure
-                with open("project_structure.json", "w") as f:
-                    json.dump(suggested_structure, f, indent=2)
+                write_json_file("project_structure.json", suggested_structure)
                 
                 # Create new structure
                 create_project_structure(suggested_structure)
@@ -3670,88 +4906,130 @@ def generate():
         print("Skipping code/content generation. Restart DevLM in test mode using --mode test.")
         exit()
 
+    # File list of the last structure seen; only rebuilt when the layout changes
+    collected_structure = None
+    files_to_process = []
+
+    # technical_brief stays in memory for the whole run; this process is its only
+    # writer, so it isn't re-read from disk each iteration. file_index shares its
+    # entry dicts and is extended as entries are added.
+    file_index = build_file_index(technical_brief["directories"])
+    # Files in the same directory get the same context, so it is built and
+    # rendered once per directory. Renderings carry over to the next iteration
+    # until the brief changes (or a file is added to that directory).
+    directory_contexts = {}
+
     while not all_done and current_iteration < max_iterations:
         current_iteration += 1
         print(f"Starting iteration {current_iteration}")
 
         all_done = True
         # Generate project structure since files may have been deleted, added, or renamed
-        project_structure = generate_project_structure()
-        save_project_structure(project_structure)
-
-        structure = get_project_structure()
-        files_to_process = []
-
-        def collect_file_paths(directory, current_path=""):
-            if isinstance(directory, list):
-                return [os.path.join(current_path, item) for item in directory if isinstance(item, str) and item not in preserve_files]
-            elif isinstance(directory, dict):
-                files = []
-                for subdir, items in directory.items():
-                    new_path = os.path.join(current_path, subdir)
-                    files.extend(collect_file_paths(items, new_path))
-                return files
-            return []
-    
-        files_to_process = collect_file_paths(structure)
-
-        for file_path in files_to_process:
-            if os.path.isdir(file_path):
-                continue  # Skip directories
-
-            with open(TECHNICAL_BRIEF_FILE, 'r') as f:
-                technical_brief = json.load(f)
+        structure, _ = refresh_project_structure()
+        if structure is not collected_structure:
+            files_to_process = collect_file_paths(structure, preserve_files)
+            collected_structure = structure
+
+        # The brief is updated in memory and saved once at the end of the iteration
+        brief_dirty = False
+
+        # Generate content for the files concurrently; results are written and
+        # folded into the technical brief one at a time as they arrive
+        pending_files = {}
+        jobs = []
+        # Directories whose files changed; summarised once after all files are done
+        summary_directories = set()
+        # Small files written this iteration, whose brief entries are requested in batches
+        deferred_briefs = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=GENERATE_MAX_WORKERS) as executor:
+                for file_path in files_to_process:
+                    if os.path.isdir(file_path):
+                        continue  # Skip directories
 
-            file_entry = find_file_entry(technical_brief["directories"], file_path)
-            
-            if file_entry is None:
-                print(f"Warning: File entry not found for {file_path}. Creating a new entry.")
-                file_entry = {"name": os.path.basename(file_path), "functions": [], "status": "not_started", "last_updated_iteration": 0}
-                update_file_entry(technical_brief["directories"], file_path, file_entry)
-
-            print(f"Processing {file_path} (status: {file_entry.get('status', 'unknown')}), last updated: {file_entry.get('last_updated_iteration', 0)}")
-            if file_entry.get("status") != "done":
-                all_done = False
-
-            # Process the file if it's not done or hasn't been updated in the current iteration
-            if (file_entry.get("status") != "done") and (file_entry.get("last_updated_iteration", 0) < current_iteration):
-                all_done = False
-                
-                # Handle root directory files differently
-                if os.path.dirname(file_path) == '':
-                    dir_to_create = '.'
-                else:
-                    dir_to_create = os.path.dirname(file_path)
-                
-                # Ensure the directory exists
-                os.makedirs(dir_to_create, exist_ok=True)
-                
-                try:
-                    with open(file_path, 'r') as f:
-                        previous_content = f.read()
-                except FileNotFoundError:
-                    previous_content = ""
+                    file_entry = file_index.get(file_path)
                 
-                try:
-                    context = get_context_for_file(file_path, technical_brief)
-                    content = get_file_content(file_path, project_summary, context, previous_content, current_iteration, max_iterations)
-                    if content:
-                        with open(file_path, 'w') as f:
-                            f.write(content)
-                        print(f"Updated {file_path}")
-                        technical_brief = update_technical_brief(file_path, content, current_iteration)
-                    else:
-                        print(f"Failed to update {file_path}")
-                        raise Exception(f"Failed to generate content for {file_path}")
-                except Exception as e:
-                    print(f"Error processing {file_path}: {str(e)}")
-                    file_entry["status"] = "error"
-                    file_entry["last_updated_iteration"] = current_iteration
-                    update_file_entry(technical_brief["directories"], file_path, file_entry)
-                    save_technical_brief(technical_brief)
+                    if file_entry is None:
+                        print(f"Warning: File entry not found for {file_path}. Creating a new entry.")
+                        file_entry = {"name": os.path.basename(file_path), "functions": [], "status": "not_started", "last_updated_iteration": 0}
+                        update_file_entry(technical_brief["directories"], file_path, file_entry)
+                        file_index[file_path] = file_entry
+                        directory_contexts.pop(os.path.dirname(file_path), None)
+                        brief_dirty = True
+
+                    print(f"Processing {file_path} (status: {file_entry.get('status', 'unknown')}), last updated: {file_entry.get('last_updated_iteration', 0)}")
+                    if file_entry.get("status") != "done":
+                        all_done = False
+
+                    # Process the file if it's not done or hasn't been updated in the current iteration
+                    if (file_entry.get("status") != "done") and (file_entry.get("last_updated_iteration", 0) < current_iteration):
+                        all_done = False
+                        directory = os.path.dirname(file_path)
+                        if directory not in directory_contexts:
+                            directory_contexts[directory] = pretty_json(get_context_for_file(file_path, technical_brief))
+                        context = directory_contexts[directory]
+                        if len(context) > BRIEF_CONTEXT_MAX_CHARS:
+                            context = pretty_json(trim_context_todos(get_context_for_file(file_path, technical_brief), file_entry["name"]))
+                        jobs.append((file_path, file_entry, context))
 
-            else:
-                print(f"Skipping {file_path} - already processed or marked as done")
+                    else:
+                        print(f"Skipping {file_path} - already processed or marked as done")
+
+                # Ensure each target directory exists, then read the current contents concurrently
+                for dir_to_create in {os.path.dirname(file_path) or '.' for file_path, _, _ in jobs}:
+                    os.makedirs(dir_to_create, exist_ok=True)
+                previous_contents = read_files([file_path for file_path, _, _ in jobs])
+                jobs = [(file_path, file_entry, context, previous_contents[file_path] or "")
+                        for file_path, file_entry, context in jobs]
+
+                batch_responses = {}
+                if GENERATE_USE_BATCH and hasattr(llm_client, "generate_responses_batch"):
+                    batch_responses = generate_file_contents_batch(jobs, project_summary, current_iteration, max_iterations)
+
+                for index, (file_path, file_entry, context, previous_content) in enumerate(jobs):
+                    # Files missing from the batch results fall back to a direct request
+                    future = executor.submit(generate_file, file_path, project_summary, context, previous_content,
+                                             current_iteration, max_iterations, batch_responses.get(f"file-{index}"))
+                    pending_files[future] = (file_path, file_entry)
+
+                for future in concurrent.futures.as_completed(pending_files):
+                    file_path, file_entry = pending_files[future]
+                    try:
+                        content, brief_content = future.result()
+                        if content:
+                            with open(file_path, 'w') as f:
+                                f.write(content)
+                            print(f"Updated {file_path}")
+                            if brief_content is None and len(content) <= BRIEF_BATCH_FILE_MAX_CHARS:
+                                deferred_briefs.append((file_path, content, file_entry))
+                                continue
+                            update_technical_brief(file_path, content, current_iteration, brief=technical_brief,
+                                                   brief_content=brief_content, file_entry=file_entry,
+                                                   summary_directories=summary_directories)
+                            brief_dirty = True
+                        else:
+                            print(f"Failed to update {file_path}")
+                            raise Exception(f"Failed to generate content for {file_path}")
+                    except Exception as e:
+                        print(f"Error processing {file_path}: {str(e)}")
+                        # file_entry is the brief's own entry, so updating it in place is enough
+                        file_entry["status"] = "error"
+                        file_entry["last_updated_iteration"] = current_iteration
+                        brief_dirty = True
+
+            if deferred_briefs:
+                batch_briefs = generate_file_briefs_batched([(file_path, content) for file_path, content, _ in deferred_briefs])
+                for file_path, content, file_entry in deferred_briefs:
+                    update_technical_brief(file_path, content, current_iteration, brief=technical_brief,
+                                           brief_content=batch_briefs.get(file_path), file_entry=file_entry,
+                                           summary_directories=summary_directories)
+                brief_dirty = True
+
+            update_directory_summaries(technical_brief, summary_directories)
+        finally:
+            if brief_dirty:
+                save_technical_brief(technical_brief)
+                directory_contexts.clear()
 
         print(f"Iteration {current_iteration} completed")
         time.sleep(1)  # Add a small delay to avoid rate limiting
@@ -3801,7 +5079,7 @@ def load_env_variables():
                 exit(1)
 
 def main():
-    global frontend_testing_enabled, browser, MODEL, SOURCE, API_KEY, PROJECT_ID, REGION, TASK, llm_client, WRITE_MODE, SERVER, DEBUG_PROMPT
+    global frontend_testing_enabled, browser, MODEL, SOURCE, API_KEY, PROJECT_ID, REGION, TASK, llm_client, WRITE_MODE, SERVER, DEBUG_PROMPT, PROJECT_ROOT, GENERATE_USE_BATCH, BATCH_TIMEOUT, RESPONSE_CACHE_ENABLED
 
     parser = argparse.ArgumentParser(description="DevLM Bootstrap script")
     parser.add_argument("--frontend", action="store_true", help="Enable frontend testing")
@@ -3860,6 +5138,22 @@ def main():
         action="store_true",
         help="Enable debug prompt mode"
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="In generate mode, submit file generation requests as one Message Batch (only used if source is 'anthropic')"
+    )
+    parser.add_argument(
+        "--batch-timeout",
+        type=int,
+        default=BATCH_TIMEOUT,
+        help=f"Seconds to wait for a --batch batch before cancelling it and sending the requests individually (default: {BATCH_TIMEOUT})"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="In generate mode, always call the LLM instead of reusing responses cached in .devlm/cache"
+    )
     args = parser.parse_args()
 
     MODEL = args.model
@@ -3873,6 +5167,9 @@ def main():
     frontend_testing_enabled = args.frontend
     WRITE_MODE = args.write_mode
     DEBUG_PROMPT = args.debug_prompt
+    GENERATE_USE_BATCH = args.batch
+    BATCH_TIMEOUT = args.batch_timeout
+    RESPONSE_CACHE_ENABLED = not args.no_cache
     # Load environment variables and validate settings
     load_env_variables()
 
@@ -3908,6 +5205,7 @@ def main():
 
     # Change the working directory to the project path
     os.chdir(PROJECT_PATH)
+    PROJECT_ROOT = os.path.realpath(os.getcwd())
     print(f"Working directory set to: {PROJECT_PATH}")
 
     # Ensure the devlm folder exists
@@ -20,11 +20,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import tempfile
 import unittest
 
 import sys
 sys.path.append('..') 
-from bootstrap import parse_modification_commands, apply_modifications, process_file_modifications
+from bootstrap import parse_modification_commands, apply_modifications, process_file_modifications, apply_changes, find_json_object, build_file_index, get_file_technical_brief, find_code_block, write_changed_tail, read_file
 
 class TestFileModifications(unittest.TestCase):
     def setUp(self):
@@ -242,6 +244,84 @@ if __name__ == "__main__":
         self.assertEqual(modified, expected_output)
         self.assertIn('Modified lines 1-4:', summary2)
 
+class TestApplyChanges(unittest.TestCase):
+    def setUp(self):
+        self.sample_content = "Line 1\nLine 2\nLine 3\nLine 4"
+
+    def test_addition_and_modification(self):
+        changes = ["+2:Added", "4:Modified"]
+        modified = apply_changes(self.sample_content, changes)
+        self.assertEqual(modified, "Line 1\nAdded\nLine 2\nLine 3\nModified")
+
+    def test_addition_on_deleted_line_keeps_following_lines(self):
+        changes = ["-2:", "+2:Replacement", "+2:Another"]
+        modified = apply_changes(self.sample_content, changes)
+        self.assertEqual(modified, "Line 1\nReplacement\nAnother\nLine 3\nLine 4")
+
+    def test_changes_beyond_end_of_file(self):
+        changes = ["+6:Last", "5:Appended"]
+        modified = apply_changes(self.sample_content, changes)
+        self.assertEqual(modified, "Line 1\nLine 2\nLine 3\nLine 4\nAppended\nLast")
+
+class TestFindJsonObject(unittest.TestCase):
+    def test_stops_at_balancing_brace(self):
+        text = 'Structure: {"src": ["a.py"], "note": "use {braces}"}\nExplanation {not json}'
+        start, end = find_json_object(text)
+        self.assertEqual(text[start:end], '{"src": ["a.py"], "note": "use {braces}"}')
+
+    def test_unbalanced_object(self):
+        self.assertIsNone(find_json_object('{"src": ["a.py"]'))
+        self.assertIsNone(find_json_object('no object here'))
+
+class TestFindCodeBlock(unittest.TestCase):
+    def test_first_block_body(self):
+        text = "Here it is:\n```python\nprint('a')\n```\nand\n```\nother\n```"
+        self.assertEqual(find_code_block(text), "print('a')")
+
+    def test_skips_fence_with_non_word_tag(self):
+        self.assertEqual(find_code_block("```c++\nx\n```\nbody\n```"), "body")
+
+    def test_unclosed_block(self):
+        self.assertIsNone(find_code_block("```python\nprint('a')\n"))
+        self.assertIsNone(find_code_block("no code here"))
+
+class TestWriteChangedTail(unittest.TestCase):
+    def rewrite(self, old_data, new_data):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "file.txt")
+            with open(file_path, 'wb') as f:
+                f.write(old_data)
+            write_changed_tail(file_path, old_data, new_data)
+            with open(file_path, 'rb') as f:
+                return f.read()
+
+    def test_longer_and_shorter_content(self):
+        self.assertEqual(self.rewrite(b"line 1\nline 2\n", b"line 1\nline two\nline 3\n"), b"line 1\nline two\nline 3\n")
+        self.assertEqual(self.rewrite(b"line 1\nline 2\n", b"line 1\n"), b"line 1\n")
+        self.assertEqual(self.rewrite(b"abc", b"xbc"), b"xbc")
+
+class TestReadFile(unittest.TestCase):
+    def test_translates_newlines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "file.txt")
+            with open(file_path, 'wb') as f:
+                f.write(b"line 1\r\nline 2\rline 3\n")
+            self.assertEqual(read_file(file_path), "line 1\nline 2\nline 3\n")
+
+class TestGetFileTechnicalBrief(unittest.TestCase):
+    def setUp(self):
+        self.entry = {"name": "main.py", "functions": []}
+        self.brief = {"directories": {"files": [{"name": "README.md"}], "directories": {
+            "src": {"files": [self.entry], "directories": {}}}}}
+
+    def test_index_lookup(self):
+        file_index = build_file_index(self.brief["directories"])
+        self.assertIs(get_file_technical_brief(self.brief, "./src/main.py", file_index), self.entry)
+
+    def test_walk_without_index(self):
+        self.assertIs(get_file_technical_brief(self.brief, "src/main.py"), self.entry)
+        self.assertIsNone(get_file_technical_brief(self.brief, "src/missing.py"))
+
 def test_addition_with_surrounding_text_and_newlines(self):
     """Test parsing ADD commands that are embedded within explanatory text and contain multiple newlines"""
     llm_response = """I'll add a docstring to the function to better document its purpose: